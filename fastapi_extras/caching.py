@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import zlib
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Collection,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from fastapi_extras.databases.memory import Cache
+from fastapi_extras.metrics import Metrics
+
+try:
+    from fastapi_extras.databases.redis import RedisManager
+except ImportError:  # pragma: no cover
+    RedisManager = None  # type: ignore[assignment,misc]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE_TTL = 60  # seconds
+DEFAULT_COMPRESS_THRESHOLD = 1024  # bytes
+DEFAULT_NAMESPACE = "response"
+
+RESPONSE_CACHE_METRIC = "response_cache_results"
+
+# Recomputed on every response rather than replayed from the cache
+VOLATILE_HEADERS = frozenset({"content-length", "x-cache"})
+
+Endpoint = TypeVar("Endpoint", bound=Callable[..., Any])
+KeyBuilder = Callable[[Request], str]
+RouteHandler = Callable[[Request], Awaitable[Response]]
+
+
+class CacheOptions(NamedTuple):
+    ttl: Optional[int]
+    vary: Collection[str]
+    key: Optional[KeyBuilder]
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison function
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    return opaque(etag) in {opaque(tag) for tag in if_none_match.split(",")}
+
+
+def cacheable(response: Response) -> bool:
+    cache_control = response.headers.get("cache-control", "").lower()
+
+    return (
+        response.status_code == 200
+        and isinstance(getattr(response, "body", None), bytes)
+        and "set-cookie" not in response.headers
+        and "no-store" not in cache_control
+        and "private" not in cache_control
+    )
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        cache: Union[Cache, Callable[[], Cache]],
+        ttl: Optional[int] = DEFAULT_RESPONSE_TTL,
+        vary: Collection[str] = (),
+        namespace: str = DEFAULT_NAMESPACE,
+        compress_threshold: Optional[int] = DEFAULT_COMPRESS_THRESHOLD,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        # A factory lets per-event-loop clients be used, e.g. lambda: redis_manager.client. A
+        # RedisManager is callable too, but as a dependency generator, so it is resolved here.
+        self.get_cache: Callable[[], Cache]
+
+        if RedisManager is not None and isinstance(cache, RedisManager):
+            self.get_cache = lambda: cache.client
+        else:
+            self.get_cache = cache if callable(cache) else lambda: cache
+        self.ttl = ttl
+        self.vary = tuple(header.lower() for header in vary)
+        self.namespace = namespace
+        self.compress_threshold = compress_threshold
+        self.metrics = metrics
+        self.route_class = self.make_route_class()
+
+    def __call__(
+        self,
+        ttl: Optional[int] = None,
+        vary: Collection[str] = (),
+        key: Optional[KeyBuilder] = None,
+    ) -> Callable[[Endpoint], Endpoint]:
+        options = CacheOptions(
+            ttl=self.ttl if ttl is None else ttl,
+            vary=self.vary + tuple(header.lower() for header in vary),
+            key=key,
+        )
+
+        def decorator(endpoint: Endpoint) -> Endpoint:
+            endpoint.__response_cache__ = options  # type: ignore[attr-defined]
+            return endpoint
+
+        return decorator
+
+    def make_route_class(self) -> Type[APIRoute]:
+        response_cache = self
+
+        class CachedRoute(APIRoute):
+            def get_route_handler(self) -> RouteHandler:
+                handler = super().get_route_handler()
+                options = getattr(self.endpoint, "__response_cache__", None)
+
+                if options is None:
+                    return handler
+
+                return response_cache.wrap(handler, options)
+
+        return CachedRoute
+
+    def key(self, request: Request, vary: Collection[str]) -> str:
+        key = f"{self.namespace}:{request.url.path}"
+        query = sorted(request.query_params.multi_items())
+        headers = [
+            (header, request.headers[header]) for header in vary if header in request.headers
+        ]
+
+        if query or headers:
+            seed = json.dumps([query, headers], separators=(",", ":"))
+            key += ":" + hashlib.blake2b(seed.encode(), digest_size=16).hexdigest()
+
+        return key
+
+    def dumps(self, response: Response) -> bytes:
+        body = response.body
+        compressed = self.compress_threshold is not None and len(body) >= self.compress_threshold
+        headers = [
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, value in response.raw_headers
+            if name.decode("latin-1") not in VOLATILE_HEADERS
+        ]
+        meta = {"status": response.status_code, "headers": headers, "zlib": compressed}
+
+        if compressed:
+            body = zlib.compress(body)
+
+        return json.dumps(meta, separators=(",", ":")).encode() + b"\n" + body
+
+    def loads(self, value: Union[str, bytes]) -> Response:
+        if isinstance(value, str):
+            value = value.encode("latin-1")
+
+        header, _, body = value.partition(b"\n")
+        meta = json.loads(header)
+
+        if meta["zlib"]:
+            body = zlib.decompress(body)
+
+        response = Response(content=body, status_code=meta["status"])
+        response.raw_headers.extend(
+            (name.encode("latin-1"), value.encode("latin-1")) for name, value in meta["headers"]
+        )
+
+        return response
+
+    def not_modified(self, response: Response) -> Response:
+        headers: List[Tuple[bytes, bytes]] = [
+            (name, value)
+            for name, value in response.raw_headers
+            if name in (b"etag", b"cache-control", b"vary", b"expires", b"x-cache")
+        ]
+        not_modified = Response(status_code=304)
+        not_modified.raw_headers.extend(headers)
+
+        return not_modified
+
+    def wrap(self, handler: RouteHandler, options: CacheOptions) -> RouteHandler:
+        async def cached_handler(request: Request) -> Response:
+            if request.method not in ("GET", "HEAD"):
+                return await handler(request)
+
+            cache = self.get_cache()
+            key = (
+                options.key(request) if options.key is not None else self.key(request, options.vary)
+            )
+
+            value = None
+            try:
+                value = await cache.get(key)
+            except Exception as cache_error:
+                logger.warning("Cache get failed, proceeding without cache: %s", cache_error)
+
+            response: Optional[Response] = None
+
+            if value is not None:
+                try:
+                    response = self.loads(value)
+                except Exception as codec_error:
+                    logger.warning("Cache entry is unreadable, ignoring it: %s", codec_error)
+
+            if response is not None:
+                result = "hit"
+            else:
+                response = await handler(request)
+
+                if cacheable(response):
+                    result = "miss"
+
+                    if "etag" not in response.headers:
+                        response.headers["etag"] = etag_for(response.body)
+
+                    try:
+                        await cache.set(key, self.dumps(response), options.ttl)
+                    except Exception as cache_error:
+                        logger.warning(
+                            "Cache set failed, proceeding without cache: %s", cache_error
+                        )
+                else:
+                    result = "bypass"
+
+            response.headers["x-cache"] = result.upper()
+
+            if self.metrics is not None:
+                self.metrics.increment(RESPONSE_CACHE_METRIC, result=result)
+
+            etag = response.headers.get("etag")
+            if_none_match = request.headers.get("if-none-match")
+
+            if etag is not None and if_none_match is not None and etag_matches(etag, if_none_match):
+                return self.not_modified(response)
+
+            return response
+
+        return cached_handler
@@ -0,0 +1,115 @@
+import json
+import zlib
+from typing import Any, Optional, Protocol, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+# Untagged values are JSON text, which keeps them readable by the stdlib and orjson codecs as well
+# as by older releases. Binary formats are prefixed with a NUL byte followed by a format tag.
+MSGPACK_TAG = b"\x00m"
+ZLIB_TAG = b"\x00z"
+
+Encoded = Union[str, bytes]
+
+
+class Codec(Protocol):
+    def dumps(self, obj: Any) -> Encoded: ...
+    def loads(self, value: Encoded) -> Any: ...
+
+
+def loads(value: Encoded) -> Any:
+    if isinstance(value, bytes) and value[:1] == b"\x00":
+        tag, payload = value[:2], value[2:]
+
+        if tag == ZLIB_TAG:
+            return loads(zlib.decompress(payload))
+
+        if tag == MSGPACK_TAG:
+            assert msgpack is not None, "msgpack is required to decode this value"
+            return msgpack.unpackb(payload)
+
+        raise ValueError(f"Unknown codec tag: {tag!r}")
+
+    if orjson is not None:
+        return orjson.loads(value)
+
+    return json.loads(value)
+
+
+class JSONCodec:
+    def dumps(self, obj: Any) -> Encoded:
+        return json.dumps(obj)
+
+    def loads(self, value: Encoded) -> Any:
+        return loads(value)
+
+
+class ORJSONCodec:
+    def __init__(self) -> None:
+        assert orjson is not None, "ORJSONCodec requires orjson: pip install orjson"
+
+    def dumps(self, obj: Any) -> Encoded:
+        return orjson.dumps(obj)
+
+    def loads(self, value: Encoded) -> Any:
+        return loads(value)
+
+
+class MsgPackCodec:
+    def __init__(self) -> None:
+        assert msgpack is not None, "MsgPackCodec requires msgpack: pip install msgpack"
+
+    def dumps(self, obj: Any) -> Encoded:
+        return MSGPACK_TAG + msgpack.packb(obj)
+
+    def loads(self, value: Encoded) -> Any:
+        return loads(value)
+
+
+class CompressedCodec:
+    def __init__(self, codec: Codec, threshold: int = 1024, level: int = 6) -> None:
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+
+    def dumps(self, obj: Any) -> Encoded:
+        value = self.codec.dumps(obj)
+
+        if len(value) < self.threshold:
+            return value
+
+        if isinstance(value, str):
+            value = value.encode()
+
+        return ZLIB_TAG + zlib.compress(value, self.level)
+
+    def loads(self, value: Encoded) -> Any:
+        return loads(value)
+
+
+def get_codec(name: str = "auto", compress_threshold: Optional[int] = None) -> Codec:
+    codec: Codec
+
+    if name == "auto":
+        codec = ORJSONCodec() if orjson is not None else JSONCodec()
+    elif name == "json":
+        codec = JSONCodec()
+    elif name == "orjson":
+        codec = ORJSONCodec()
+    elif name == "msgpack":
+        codec = MsgPackCodec()
+    else:
+        raise ValueError(f"Unknown codec: {name}")
+
+    if compress_threshold is not None:
+        codec = CompressedCodec(codec, threshold=compress_threshold)
+
+    return codec
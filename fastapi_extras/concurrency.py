@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self) -> None:
+        self.calls: Dict[Hashable, asyncio.Future[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        call = self.calls.get(key)
+
+        if call is None:
+            call = asyncio.ensure_future(func())
+            call.add_done_callback(lambda _: self._forget(key, call))
+            self.calls[key] = call
+
+        # Shielded so that a cancelled caller (e.g. a disconnected client) does not abort the
+        # shared call for everyone else waiting on the same key.
+        return await asyncio.shield(call)
+
+    def _forget(self, key: Hashable, call: "asyncio.Future[T]") -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+        if not call.cancelled():
+            call.exception()  # mark as retrieved when every waiter was cancelled
+
+
+class TaskSet:
+    def __init__(self, limit: Optional[int] = None) -> None:
+        self.tasks: Set[asyncio.Future[Any]] = set()
+        self.limit = limit
+        self.errors = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> "Optional[asyncio.Future[Any]]":
+        if self.limit is not None and len(self.tasks) >= self.limit:
+            coro.close()
+            self.dropped += 1
+            return None
+
+        task = asyncio.ensure_future(coro)
+        task.add_done_callback(self._done)
+        self.tasks.add(task)
+
+        return task
+
+    async def drain(self) -> None:
+        while self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def _done(self, task: "asyncio.Future[Any]") -> None:
+        self.tasks.discard(task)
+
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            logger.warning("Background task failed: %s", task.exception())
+
+
+class MicroBatcher(Generic[T, R]):
+    def __init__(
+        self,
+        func: Callable[[List[T]], Awaitable[List[R]]],
+        max_size: int = 64,
+        window: float = 0.005,
+    ) -> None:
+        assert max_size > 0, "max_size must be positive"
+        self.func = func
+        self.max_size = max_size
+        self.window = window
+        self.pending: List[Tuple[T, asyncio.Future[R]]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks = TaskSet()
+
+    async def submit(self, item: T) -> R:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((item, future))
+
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+        return await future
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if self.pending:
+            batch, self.pending = self.pending, []
+            self.tasks.spawn(self._run(batch))
+
+    async def drain(self) -> None:
+        self.flush()
+        await self.tasks.drain()
+
+    async def _run(self, batch: "List[Tuple[T, asyncio.Future[R]]]") -> None:
+        try:
+            results = await self.func([item for item, _ in batch])
+
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} results, got {len(results)}")
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        assert failure_threshold > 0, "failure_threshold must be positive"
+        assert half_open_max_calls > 0, "half_open_max_calls must be positive"
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.timer = timer
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probes = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if self.timer() - self.opened_at < self.recovery_timeout:
+                return False
+
+            self.state = self.HALF_OPEN
+            self.probes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.half_open_max_calls:
+                return False
+
+            self.probes += 1
+
+        return True
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def release(self) -> None:
+        # Hands back a half-open probe slot whose call ended without a verdict (e.g. cancelled)
+        if self.state == self.HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def record_failure(self) -> None:
+        self.failures += 1
+
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = self.timer()
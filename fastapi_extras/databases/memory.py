@@ -0,0 +1,190 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import (
+    Callable,
+    List,
+    Mapping,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    Union,
+    runtime_checkable,
+)
+
+from fastapi_extras.codecs import Encoded
+
+DEFAULT_MAXSIZE = 4096
+
+TTLs = Union[int, None, Mapping[str, Optional[int]]]
+
+
+def ttl_for(ttl: TTLs, key: str) -> Optional[int]:
+    return ttl.get(key) if isinstance(ttl, Mapping) else ttl
+
+
+@runtime_checkable
+class Cache(Protocol):
+    async def get(self, key: str) -> Optional[Encoded]: ...
+    async def set(self, key: str, value: Encoded, ttl: Optional[int] = None) -> None: ...
+
+
+@runtime_checkable
+class BatchCache(Cache, Protocol):
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Encoded]]: ...
+    async def set_many(self, mapping: Mapping[str, Encoded], ttl: TTLs = None) -> None: ...
+
+
+async def get_many(cache: Cache, keys: Sequence[str]) -> List[Optional[Encoded]]:
+    if isinstance(cache, BatchCache):
+        return await cache.get_many(keys)
+
+    return list(await asyncio.gather(*(cache.get(key) for key in keys)))
+
+
+async def set_many(cache: Cache, mapping: Mapping[str, Encoded], ttl: TTLs = None) -> None:
+    if isinstance(cache, BatchCache):
+        return await cache.set_many(mapping, ttl)
+
+    await asyncio.gather(
+        *(cache.set(key, value, ttl_for(ttl, key)) for key, value in mapping.items())
+    )
+
+
+class LocalCache:
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_MAXSIZE,
+        ttl: Optional[float] = None,
+        maxbytes: Optional[int] = None,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        assert maxsize > 0, "maxsize must be positive"
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.timer = timer
+        self.nbytes = 0
+        self.entries: OrderedDict[str, Tuple[Optional[float], Encoded]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get_nowait(self, key: str) -> Optional[Encoded]:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+
+        if expires_at is not None and expires_at <= self.timer():
+            self.evict(key)
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def set_nowait(self, key: str, value: Encoded, ttl: Optional[float] = None) -> None:
+        if ttl is None or (self.ttl is not None and self.ttl < ttl):
+            ttl = self.ttl
+
+        if ttl is not None and ttl <= 0:
+            return
+
+        self.evict(key)
+        self.entries[key] = (None if ttl is None else self.timer() + ttl, value)
+        self.nbytes += len(key) + len(value)
+
+        while len(self.entries) > self.maxsize or (
+            self.maxbytes is not None and self.nbytes > self.maxbytes and self.entries
+        ):
+            self.evict(next(iter(self.entries)))
+
+    def evict(self, key: str) -> bool:
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            return False
+
+        self.nbytes -= len(key) + len(entry[1])
+        return True
+
+    def evict_prefix(self, prefix: str) -> int:
+        keys = [key for key in self.entries if key.startswith(prefix)]
+
+        for key in keys:
+            self.evict(key)
+
+        return len(keys)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.nbytes = 0
+
+    async def get(self, key: str) -> Optional[Encoded]:
+        return self.get_nowait(key)
+
+    async def set(self, key: str, value: Encoded, ttl: Optional[int] = None) -> None:
+        self.set_nowait(key, value, ttl)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Encoded]]:
+        return [self.get_nowait(key) for key in keys]
+
+    async def set_many(self, mapping: Mapping[str, Encoded], ttl: TTLs = None) -> None:
+        for key, value in mapping.items():
+            self.set_nowait(key, value, ttl_for(ttl, key))
+
+
+class TieredCache:
+    def __init__(
+        self, local: LocalCache, remote: Optional[Cache] = None, ttl: Optional[float] = None
+    ) -> None:
+        self.local = local
+        self.remote = remote
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[Encoded]:
+        value = self.local.get_nowait(key)
+
+        if value is not None or self.remote is None:
+            return value
+
+        value = await self.remote.get(key)
+
+        if value is not None:
+            self.local.set_nowait(key, value, self.ttl)
+
+        return value
+
+    def local_ttl(self, ttl: Optional[float]) -> Optional[float]:
+        return ttl if self.ttl is None or (ttl is not None and ttl < self.ttl) else self.ttl
+
+    async def set(self, key: str, value: Encoded, ttl: Optional[int] = None) -> None:
+        self.local.set_nowait(key, value, self.local_ttl(ttl))
+
+        if self.remote is not None:
+            await self.remote.set(key, value, ttl)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Encoded]]:
+        values = [self.local.get_nowait(key) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is None]
+
+        if not missing or self.remote is None:
+            return values
+
+        fetched = await get_many(self.remote, missing)
+        found = {key: value for key, value in zip(missing, fetched) if value is not None}
+
+        for key, value in found.items():
+            self.local.set_nowait(key, value, self.ttl)
+
+        return [found.get(key) if value is None else value for key, value in zip(keys, values)]
+
+    async def set_many(self, mapping: Mapping[str, Encoded], ttl: TTLs = None) -> None:
+        for key, value in mapping.items():
+            self.local.set_nowait(key, value, self.local_ttl(ttl_for(ttl, key)))
+
+        if self.remote is not None:
+            await set_many(self.remote, mapping, ttl)
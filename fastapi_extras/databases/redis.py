@@ -1,27 +1,737 @@
-from typing import Any, AsyncGenerator, Optional, Union
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import math
+import random
+import secrets
+import time
+import weakref
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from urllib.parse import unquote, urlsplit, urlunsplit
 
 import redis.asyncio as redis
 from pydantic import RedisDsn
+from redis.asyncio.sentinel import Sentinel, SentinelConnectionPool
+from redis.exceptions import NoScriptError
+
+from fastapi_extras.codecs import get_codec
+from fastapi_extras.concurrency import CircuitBreaker, SingleFlight, TaskSet
+from fastapi_extras.databases.memory import LocalCache, TTLs, ttl_for
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INVALIDATION_CHANNEL = "fastapi_extras:invalidate"
+DEFAULT_RECONNECT_DELAY = 1.0  # seconds
+DEFAULT_REPLICA_RETRY = 5.0  # seconds
+DEFAULT_SENTINEL_PORT = 26379
+DEFAULT_MEMOIZE_TTL = 300  # seconds
+DEFAULT_LOCK_TIMEOUT = 10.0  # seconds
+DEFAULT_LOCK_POLL = 0.05  # seconds
+
+CLUSTER_SCHEMES = {"redis+cluster": "redis", "rediss+cluster": "rediss"}
+SENTINEL_SCHEMES = {"redis+sentinel", "rediss+sentinel"}
+
+# Only simple, non-blocking commands are safe to batch behind the caller's back
+AUTO_PIPELINE_COMMANDS = frozenset(
+    {
+        "DEL",
+        "EXISTS",
+        "EXPIRE",
+        "GET",
+        "HDEL",
+        "HGET",
+        "HGETALL",
+        "HSET",
+        "INCR",
+        "INCRBY",
+        "MGET",
+        "PEXPIRE",
+        "PTTL",
+        "SET",
+        "TTL",
+        "UNLINK",
+    }
+)
+
+# Commands that may be answered by a replica; cursor-based commands are excluded because a cursor
+# is only meaningful on the node that issued it.
+READ_ONLY_COMMANDS = frozenset(
+    {
+        "EXISTS",
+        "GET",
+        "GETRANGE",
+        "HEXISTS",
+        "HGET",
+        "HGETALL",
+        "HLEN",
+        "HMGET",
+        "MGET",
+        "PTTL",
+        "STRLEN",
+        "TTL",
+    }
+)
+
+Replica = Tuple["Redis", CircuitBreaker]
+T = TypeVar("T")
+
+# Deletes the lock only if it still holds our token, so an expired lock that has since been taken
+# over by another caller is never released from under it.
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+RELEASE_LOCK_SHA = hashlib.sha1(RELEASE_LOCK_SCRIPT.encode()).hexdigest()
 
 
 class Redis(redis.Redis):
-    async def get(self, key: str, *args: Any, **kwargs: Any) -> Optional[str]:
+    def __init__(
+        self,
+        *args: Any,
+        auto_pipeline: bool = False,
+        pipeline_window: float = 0,
+        replicas: Sequence[Replica] = (),
+        replica_fallback: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.auto_pipeline = auto_pipeline
+        self.pipeline_window = pipeline_window
+        self.replicas = list(replicas)
+        self.replica_fallback = replica_fallback
+        self.next_replica = 0
+        self.pending: List[Tuple[Tuple[Any, ...], Dict[str, Any], asyncio.Future[Any]]] = []
+        self.flush_handle: Optional[asyncio.Handle] = None
+        self.flushes = TaskSet()
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        if self.replicas and str(args[0]).upper() in READ_ONLY_COMMANDS:
+            return await self.execute_read(*args, **options)
+
+        return await self.execute_primary(*args, **options)
+
+    async def execute_read(self, *args: Any, **options: Any) -> Any:
+        error: Optional[Exception] = None
+
+        for _ in range(len(self.replicas)):
+            replica, breaker = self.replicas[self.next_replica % len(self.replicas)]
+            self.next_replica += 1
+
+            if not breaker.allow():
+                continue
+
+            try:
+                result = await replica.execute_command(*args, **options)
+            except (redis.ConnectionError, redis.TimeoutError) as exc:
+                logger.warning("Redis replica unavailable: %s", exc)
+                breaker.record_failure()
+                error = exc
+            else:
+                breaker.record_success()
+                return result
+
+        if not self.replica_fallback:
+            raise error or redis.ConnectionError("No healthy Redis replica available")
+
+        return await self.execute_primary(*args, **options)
+
+    async def execute_primary(self, *args: Any, **options: Any) -> Any:
+        if not self.auto_pipeline or str(args[0]).upper() not in AUTO_PIPELINE_COMMANDS:
+            return await super().execute_command(*args, **options)
+
+        # Commands issued by concurrent coroutines are queued and sent together in one
+        # non-transactional pipeline at the end of the current loop tick (or pipeline window).
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((args, options, future))
+
+        if self.flush_handle is None:
+            if self.pipeline_window > 0:
+                self.flush_handle = loop.call_later(self.pipeline_window, self.flush)
+            else:
+                self.flush_handle = loop.call_soon(self.flush)
+
+        return await future
+
+    def flush(self) -> None:
+        self.flush_handle = None
+        batch, self.pending = self.pending, []
+
+        if batch:
+            self.flushes.spawn(self.execute_pipeline(batch))
+
+    async def execute_pipeline(
+        self, batch: List[Tuple[Tuple[Any, ...], Dict[str, Any], "asyncio.Future[Any]"]]
+    ) -> None:
+        pipe = self.pipeline(transaction=False)
+
+        for args, options, _ in batch:
+            pipe.execute_command(*args, **options)
+
+        try:
+            results = await pipe.execute(raise_on_error=False)
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def aclose(self, close_connection_pool: Optional[bool] = None) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush()
+
+        await self.flushes.drain()
+        await super().aclose(close_connection_pool)
+
+    async def get(self, key: str, *args: Any, **kwargs: Any) -> Optional[Union[str, bytes]]:
         return await super().get(key, *args, **kwargs)
 
     async def set(
-        self, key: str, value: str, ttl: Optional[int] = None, *args: Any, **kwargs: Any
+        self,
+        key: str,
+        value: Union[str, bytes],
+        ttl: Optional[int] = None,
+        *args: Any,
+        **kwargs: Any,
     ) -> None:
         await super().set(key, value, ttl, *args, **kwargs)
 
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Union[str, bytes]]]:
+        if not keys:
+            return []
+
+        return await self.mget(keys)
+
+    async def set_many(self, mapping: Mapping[str, Union[str, bytes]], ttl: TTLs = None) -> None:
+        if not mapping:
+            return
+
+        pipe = self.pipeline(transaction=False)
+
+        for key, value in mapping.items():
+            pipe.set(key, value, ttl_for(ttl, key))
+
+        await pipe.execute()
+
+
+class RedisCluster(redis.RedisCluster):
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Union[str, bytes]]]:
+        if not keys:
+            return []
+
+        return await self.mget_nonatomic(keys)
+
+    async def set_many(self, mapping: Mapping[str, Union[str, bytes]], ttl: TTLs = None) -> None:
+        if not mapping:
+            return
+
+        pipe = self.pipeline()
+
+        for key, value in mapping.items():
+            pipe.set(key, value, ttl_for(ttl, key))
+
+        await pipe.execute()
+
+
+def parse_sentinel_url(url: str) -> Tuple[List[Tuple[str, int]], str, Dict[str, Any]]:
+    # redis+sentinel://[[username]:password@]host[:port][,host[:port]...]/service[/db]
+    parts = urlsplit(url)
+    userinfo, _, hosts = parts.netloc.rpartition("@")
+    path = [segment for segment in parts.path.split("/") if segment]
+
+    if not path:
+        raise ValueError("Sentinel URL must include a service name")
+
+    sentinels = []
+
+    for host in hosts.split(","):
+        name, _, port = host.partition(":")
+        sentinels.append((name, int(port or DEFAULT_SENTINEL_PORT)))
+
+    kwargs: Dict[str, Any] = {"db": int(path[1]) if len(path) > 1 else 0}
+
+    if userinfo:
+        username, _, password = userinfo.rpartition(":")
+        kwargs["username"] = unquote(username) or None
+        kwargs["password"] = unquote(password) or None
+
+    if parts.scheme.startswith("rediss"):
+        kwargs["ssl"] = True
+
+    return sentinels, unquote(path[0]), kwargs
+
 
 class RedisManager:
-    def __init__(self, url: Union[RedisDsn, str]):
-        self.pool = redis.ConnectionPool.from_url(str(url))
+    def __init__(
+        self,
+        url: Union[RedisDsn, str],
+        min_connections: int = 0,
+        health_check: bool = True,
+        preload_scripts: bool = False,
+        auto_pipeline: bool = False,
+        pipeline_window: float = 0,
+        replicas: Sequence[Union[RedisDsn, str]] = (),
+        read_from_replicas: bool = False,
+        replica_fallback: bool = True,
+        replica_retry: float = DEFAULT_REPLICA_RETRY,
+        max_replica_lag: Optional[float] = None,
+        replica_check_interval: Optional[float] = None,
+        **kwargs: Any,
+    ):
+        url = str(url)
+        scheme = urlsplit(url).scheme
+        self.cluster_url: Optional[str] = None
+        self.pool: Optional[redis.ConnectionPool] = None
+        self.replica_pools: List[redis.ConnectionPool] = []
+
+        if scheme in CLUSTER_SCHEMES:
+            # Cluster clients discover the topology and route reads to replicas themselves
+            assert not replicas, "Replica URLs are not supported with Redis Cluster"
+            self.cluster_url = urlunsplit(urlsplit(url)._replace(scheme=CLUSTER_SCHEMES[scheme]))
+            self.cluster_options = {"read_from_replicas": read_from_replicas, **kwargs}
+        elif scheme in SENTINEL_SCHEMES:
+            assert not replicas, "Sentinel discovers replicas, pass read_from_replicas instead"
+            sentinels, service, options = parse_sentinel_url(url)
+            self.sentinel = Sentinel(sentinels, sentinel_kwargs=kwargs.pop("sentinel_kwargs", None))
+            options.update(kwargs)
+            self.pool = SentinelConnectionPool(service, self.sentinel, is_master=True, **options)
+
+            # Replica pools rotate through the healthy replicas and end on the primary
+            if read_from_replicas:
+                self.replica_pools.append(
+                    SentinelConnectionPool(service, self.sentinel, is_master=False, **options)
+                )
+        else:
+            self.pool = redis.ConnectionPool.from_url(url, **kwargs)
+            self.replica_pools = [
+                redis.ConnectionPool.from_url(str(replica), **kwargs) for replica in replicas
+            ]
+
+        self.auto_pipeline = auto_pipeline
+        self.pipeline_window = pipeline_window
+        self.min_connections = min_connections
+        self.health_check = health_check
+        self.preload_scripts = preload_scripts
+        self.replica_fallback = replica_fallback
+        self.max_replica_lag = max_replica_lag
+        self.replica_check_interval = replica_check_interval
+        self.replica_breakers = [
+            CircuitBreaker(failure_threshold=1, recovery_timeout=replica_retry)
+            for _ in self.replica_pools
+        ]
+        self.monitor: Optional[asyncio.Task[None]] = None
+        self.clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, Union[Redis, RedisCluster]
+        ] = weakref.WeakKeyDictionary()
+
+    # Clients are cached per event loop: they are cheap wrappers around the shared pool, but
+    # their connections must not be awaited from a loop other than the one that opened them.
+    @property
+    def client(self) -> Union[Redis, RedisCluster]:
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+
+        if client is None:
+            client = self.clients[loop] = self.create_client()
+
+        return client
+
+    def create_client(self) -> Union[Redis, RedisCluster]:
+        if self.cluster_url is not None:
+            return RedisCluster.from_url(self.cluster_url, **self.cluster_options)
+
+        replicas = [
+            (
+                Redis(
+                    connection_pool=pool,
+                    auto_pipeline=self.auto_pipeline,
+                    pipeline_window=self.pipeline_window,
+                ),
+                breaker,
+            )
+            for pool, breaker in zip(self.replica_pools, self.replica_breakers)
+        ]
+
+        return Redis(
+            connection_pool=self.pool,
+            auto_pipeline=self.auto_pipeline,
+            pipeline_window=self.pipeline_window,
+            replicas=replicas,
+            replica_fallback=self.replica_fallback,
+        )
+
+    async def __call__(self) -> AsyncGenerator[Union[Redis, RedisCluster], None]:
+        yield self.client
+
+    async def prewarm(self, connections: int) -> None:
+        acquired = await asyncio.gather(
+            *(self.pool.get_connection("PING") for _ in range(connections)),
+            return_exceptions=True,
+        )
+
+        for connection in acquired:
+            if not isinstance(connection, BaseException):
+                await self.pool.release(connection)
+
+        errors = [error for error in acquired if isinstance(error, BaseException)]
+
+        if errors:
+            raise errors[0]
+
+    async def check_replicas(self) -> None:
+        client = self.client
+        assert isinstance(client, Redis)
 
-    async def __call__(self) -> AsyncGenerator[Redis, None]:
-        cli = Redis(connection_pool=self.pool)
+        for replica, breaker in client.replicas:
+            try:
+                info = await replica.info("replication")
+            except redis.ResponseError as error:
+                # INFO can be renamed or disabled, leave the replica to the read-path breaker
+                logger.debug("Redis replica lag unavailable: %s", error)
+                continue
+            except (redis.ConnectionError, redis.TimeoutError) as error:
+                logger.warning("Redis replica health check failed: %s", error)
+                healthy = False
+            else:
+                # master_last_io_seconds_ago grows while a replica stops hearing from its primary
+                lag = info.get("master_last_io_seconds_ago", 0)
+                healthy = info.get("master_link_status", "up") == "up" and (
+                    self.max_replica_lag is None or 0 <= lag <= self.max_replica_lag
+                )
 
+            if healthy:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+
+    async def monitor_replicas(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_replicas()
+
+    async def startup(self) -> None:
+        if self.min_connections > 0 and self.pool is not None:
+            await self.prewarm(self.min_connections)
+
+        if self.health_check:
+            await self.client.ping()
+
+        # Opt-in, since ACLs often deny @scripting and evalsha loads missing scripts anyway
+        if self.preload_scripts:
+            await preload_scripts(self.client)
+
+        if self.replica_pools:
+            await self.check_replicas()
+
+            if self.replica_check_interval is not None and self.monitor is None:
+                self.monitor = asyncio.ensure_future(
+                    self.monitor_replicas(self.replica_check_interval)
+                )
+
+    async def shutdown(self) -> None:
+        if self.monitor is not None:
+            self.monitor.cancel()
+            await asyncio.gather(self.monitor, return_exceptions=True)
+            self.monitor = None
+
+        for client in list(self.clients.values()):
+            await client.aclose()
+
+            for replica, _ in getattr(client, "replicas", ()):
+                await replica.aclose()
+
+        self.clients.clear()
+
+        for pool in [self.pool, *self.replica_pools]:
+            if pool is not None:
+                await pool.disconnect()
+
+
+class RedisInvalidator:
+    def __init__(
+        self,
+        manager: RedisManager,
+        caches: Iterable[LocalCache] = (),
+        channel: str = DEFAULT_INVALIDATION_CHANNEL,
+        reconnect_delay: float = DEFAULT_RECONNECT_DELAY,
+    ) -> None:
+        assert manager.pool is not None, "RedisInvalidator does not support Redis Cluster"
+        self.client = Redis(connection_pool=manager.pool)
+        self.caches: List[LocalCache] = list(caches)
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.listener: Optional[asyncio.Task[None]] = None
+
+    def register(self, cache: LocalCache) -> None:
+        self.caches.append(cache)
+
+    async def invalidate(self, *keys: str, delete: bool = True) -> None:
+        if delete and keys:
+            await self.client.delete(*keys)
+
+        self.evict(keys=keys)
+        await self.client.publish(self.channel, json.dumps({"keys": keys}))
+
+    async def invalidate_prefix(self, prefix: str, delete: bool = False) -> None:
+        if delete:
+            async for key in self.client.scan_iter(match=f"{prefix}*"):
+                await self.client.delete(key)
+
+        self.evict(prefix=prefix)
+        await self.client.publish(self.channel, json.dumps({"prefix": prefix}))
+
+    def evict(self, keys: Iterable[str] = (), prefix: Optional[str] = None) -> None:
+        for cache in self.caches:
+            for key in keys:
+                cache.evict(key)
+
+            if prefix is not None:
+                cache.evict_prefix(prefix)
+
+    def handle(self, data: Union[str, bytes]) -> None:
         try:
-            yield cli
+            message = json.loads(data)
+            self.evict(keys=message.get("keys", ()), prefix=message.get("prefix"))
+        except (ValueError, AttributeError, TypeError) as error:
+            logger.warning("Ignoring malformed invalidation message: %s", error)
+
+    async def subscribe(self) -> Any:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        return pubsub
+
+    async def listen(self, pubsub: Any = None) -> None:
+        try:
+            while True:
+                try:
+                    if pubsub is None:
+                        pubsub = await self.subscribe()
+
+                    async for message in pubsub.listen():
+                        self.handle(message["data"])
+                except (redis.ConnectionError, redis.TimeoutError) as error:
+                    # Invalidations published while disconnected are lost, so nothing cached
+                    # locally can be trusted anymore.
+                    logger.warning("Invalidation channel lost, flushing local caches: %s", error)
+
+                    for cache in self.caches:
+                        cache.clear()
+
+                    if pubsub is not None:
+                        await pubsub.aclose()
+                        pubsub = None
+
+                    await asyncio.sleep(self.reconnect_delay)
         finally:
-            await cli.aclose()
+            if pubsub is not None:
+                await pubsub.aclose()
+
+    async def startup(self) -> None:
+        if self.listener is None:
+            self.listener = asyncio.ensure_future(self.listen(await self.subscribe()))
+
+    async def shutdown(self) -> None:
+        if self.listener is not None:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+            self.listener = None
+
+        await self.client.aclose()
+
+
+async def evalsha(
+    client: Union[Redis, RedisCluster], script: str, sha: str, keys: Sequence[str], *args: Any
+) -> Any:
+    try:
+        return await client.evalsha(sha, len(keys), *keys, *args)
+    except NoScriptError:
+        await client.script_load(script)
+        return await client.evalsha(sha, len(keys), *keys, *args)
+
+
+class RedisLock:
+    def __init__(
+        self,
+        client: Union[Redis, RedisCluster],
+        key: str,
+        timeout: float = DEFAULT_LOCK_TIMEOUT,
+    ) -> None:
+        self.client = client
+        self.key = key
+        self.timeout = timeout
+        self.token = secrets.token_hex(16)
+        self.acquired = False
+
+    async def acquire(self) -> bool:
+        self.acquired = bool(
+            await self.client.execute_command(
+                "SET", self.key, self.token, "PX", int(self.timeout * 1000), "NX"
+            )
+        )
+        return self.acquired
+
+    async def release(self) -> bool:
+        if not self.acquired:
+            return False
+
+        self.acquired = False
+        return bool(
+            await evalsha(
+                self.client, RELEASE_LOCK_SCRIPT, RELEASE_LOCK_SHA, [self.key], self.token
+            )
+        )
+
+    async def __aenter__(self) -> bool:
+        return await self.acquire()
+
+    async def __aexit__(self, *_: Any) -> None:
+        await self.release()
+
+
+async def preload_scripts(client: Union[Redis, RedisCluster]) -> None:
+    await client.script_load(RELEASE_LOCK_SCRIPT)
+
+
+def memoize(
+    redis_client: Union[RedisManager, Callable[[], Union[Redis, RedisCluster]]],
+    ttl: int = DEFAULT_MEMOIZE_TTL,
+    beta: float = 1.0,
+    lock: bool = True,
+    lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+    lock_poll: float = DEFAULT_LOCK_POLL,
+    namespace: str = "memoize",
+    key: Optional[Callable[..., str]] = None,
+    codec: str = "auto",
+    timer: Callable[[], float] = time.time,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    get_client = (
+        (lambda: redis_client.client) if isinstance(redis_client, RedisManager) else redis_client
+    )
+    value_codec = get_codec(codec)
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        prefix = f"{namespace}:{func.__module__}.{func.__qualname__}:"
+        flights: SingleFlight[T] = SingleFlight()
+
+        def keygen(*args: Any, **kwargs: Any) -> str:
+            if key is not None:
+                return key(*args, **kwargs)
+
+            seed = json.dumps([args, sorted(kwargs.items())], default=str, separators=(",", ":"))
+            return prefix + hashlib.sha256(seed.encode()).hexdigest()
+
+        def expired(entry: Dict[str, Any]) -> bool:
+            # XFetch: recompute early with a probability that grows as expiry approaches and with
+            # how long the value takes to compute, so a single caller refreshes it ahead of time.
+            jitter = -entry["delta"] * beta * math.log(1.0 - random.random())
+            return timer() + jitter >= entry["expiry"]
+
+        # Redis errors never fail the memoized function: without a cache it is simply computed
+        async def cache_get(client: Any, cache_key: str) -> Optional[Dict[str, Any]]:
+            try:
+                raw = await client.get(cache_key)
+                return None if raw is None else value_codec.loads(raw)
+            except Exception as cache_error:
+                logger.warning("Cache get failed, proceeding without cache: %s", cache_error)
+                return None
+
+        async def compute(client: Any, cache_key: str, *args: Any, **kwargs: Any) -> T:
+            started = timer()
+            value = await func(*args, **kwargs)
+            finished = timer()
+            entry = {"value": value, "delta": finished - started, "expiry": finished + ttl}
+
+            try:
+                await client.set(cache_key, value_codec.dumps(entry), ttl)
+            except Exception as cache_error:
+                logger.warning("Cache set failed, proceeding without cache: %s", cache_error)
+
+            return value
+
+        async def wait(client: Any, cache_key: str) -> Optional[Dict[str, Any]]:
+            for _ in range(max(1, int(lock_timeout / lock_poll))):
+                await asyncio.sleep(lock_poll)
+                entry = await cache_get(client, cache_key)
+
+                if entry is not None:
+                    return entry
+
+            return None
+
+        async def recompute(
+            client: Any, cache_key: str, stale: Optional[Dict[str, Any]], *args: Any, **kwargs: Any
+        ) -> T:
+            if not lock:
+                return await compute(client, cache_key, *args, **kwargs)
+
+            redis_lock = RedisLock(client, f"{cache_key}:lock", lock_timeout)
+
+            try:
+                acquired = await redis_lock.acquire()
+            except Exception as lock_error:
+                logger.warning("Lock failed, proceeding without lock: %s", lock_error)
+                return await compute(client, cache_key, *args, **kwargs)
+
+            if acquired:
+                try:
+                    return await compute(client, cache_key, *args, **kwargs)
+                finally:
+                    try:
+                        await redis_lock.release()
+                    except Exception as lock_error:
+                        # The lock expires on its own after lock_timeout
+                        logger.warning("Lock release failed: %s", lock_error)
+
+            # Another caller is recomputing: keep serving the old value or wait for the new one,
+            # and only give up on the lock holder after the lock itself would have expired.
+            if stale is None:
+                stale = await wait(client, cache_key)
+
+            if stale is not None:
+                return stale["value"]
+
+            return await compute(client, cache_key, *args, **kwargs)
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            client = get_client()
+            cache_key = keygen(*args, **kwargs)
+            stale = await cache_get(client, cache_key)
+
+            if stale is not None and not expired(stale):
+                return stale["value"]
+
+            return await flights.do(
+                cache_key, lambda: recompute(client, cache_key, stale, *args, **kwargs)
+            )
+
+        return wrapper
+
+    return decorator
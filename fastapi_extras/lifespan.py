@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List, Optional, Protocol, TypeVar
+
+from fastapi import HTTPException, status
+
+from fastapi_extras.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+STARTUP_METRIC = "lifespan_startup_seconds"
+READY_METRIC = "lifespan_ready"
+
+
+class Resource(Protocol):
+    async def startup(self) -> None: ...
+    async def shutdown(self) -> None: ...
+
+
+R = TypeVar("R", bound=Resource)
+
+
+class ResourceManager:
+    def __init__(self, *resources: Resource, metrics: Optional[Metrics] = None) -> None:
+        self.resources: List[Resource] = list(resources)
+        self.metrics = metrics
+        self.ready = False
+
+    def register(self, resource: R) -> R:
+        assert not self.ready, "Resources must be registered before startup"
+        self.resources.append(resource)
+        return resource
+
+    async def start(self, resource: Resource) -> None:
+        started = time.perf_counter()
+        await resource.startup()
+
+        if self.metrics is not None:
+            self.metrics.observe(
+                STARTUP_METRIC, time.perf_counter() - started, resource=type(resource).__name__
+            )
+
+    async def startup(self) -> None:
+        # Resources warm up concurrently, so a cold start costs the slowest one, not their sum
+        results = await asyncio.gather(
+            *(self.start(resource) for resource in self.resources), return_exceptions=True
+        )
+        errors = [error for error in results if isinstance(error, BaseException)]
+
+        if errors:
+            # A failed startup may still have opened connections, so everything is shut down
+            await self.stop()
+            raise errors[0]
+
+        self.ready = True
+        self.set_gauge()
+
+    async def shutdown(self) -> None:
+        # Not ready first, so the load balancer stops routing here while pools are closing
+        self.ready = False
+        self.set_gauge()
+        await self.stop()
+
+    async def stop(self) -> None:
+        # Reverse registration order: dependents (e.g. an invalidator) go before what they use
+        for resource in reversed(self.resources):
+            try:
+                await resource.shutdown()
+            except Exception:
+                logger.exception("Failed to shut down %s", type(resource).__name__)
+
+    def set_gauge(self) -> None:
+        if self.metrics is not None:
+            self.metrics.gauge(READY_METRIC, 1 if self.ready else 0)
+
+    @asynccontextmanager
+    async def lifespan(self, _app: Any) -> AsyncIterator[None]:
+        await self.startup()
+
+        try:
+            yield
+        finally:
+            await self.shutdown()
+
+    async def readiness(self) -> None:
+        if not self.ready:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Not ready")
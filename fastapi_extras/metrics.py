@@ -0,0 +1,140 @@
+from typing import Any, Callable, Dict, Optional, Protocol, Sequence, Tuple
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+try:
+    from opentelemetry import metrics as otel_metrics
+except ImportError:  # pragma: no cover
+    otel_metrics = None
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+
+Callback = Callable[[str, float, Dict[str, str]], None]
+
+
+class Metrics(Protocol):
+    def increment(self, name: str, value: float = 1, **labels: str) -> None: ...
+    def observe(self, name: str, value: float, **labels: str) -> None: ...
+    def gauge(self, name: str, value: float, **labels: str) -> None: ...
+
+
+class PrometheusMetrics:
+    def __init__(
+        self,
+        namespace: str = "",
+        registry: Any = None,
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        assert prometheus_client is not None, "PrometheusMetrics requires prometheus-client"
+        self.namespace = namespace
+        self.registry = prometheus_client.REGISTRY if registry is None else registry
+        self.buckets = tuple(buckets)
+        self.collectors: Dict[Tuple[str, str], Any] = {}
+
+    def collector(self, kind: str, name: str, labels: Dict[str, str]) -> Any:
+        collector = self.collectors.get((kind, name))
+
+        if collector is None:
+            options: Dict[str, Any] = {
+                "namespace": self.namespace,
+                "labelnames": sorted(labels),
+                "registry": self.registry,
+            }
+
+            if kind == "histogram":
+                collector = prometheus_client.Histogram(name, name, buckets=self.buckets, **options)
+            elif kind == "gauge":
+                collector = prometheus_client.Gauge(name, name, **options)
+            else:
+                collector = prometheus_client.Counter(name, name, **options)
+
+            self.collectors[(kind, name)] = collector
+
+        return collector.labels(**labels) if labels else collector
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        self.collector("counter", name, labels).inc(value)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self.collector("histogram", name, labels).observe(value)
+
+    def gauge(self, name: str, value: float, **labels: str) -> None:
+        self.collector("gauge", name, labels).set(value)
+
+
+class OpenTelemetryMetrics:
+    def __init__(self, meter: Any = None, name: str = "fastapi_extras") -> None:
+        if meter is None:
+            assert otel_metrics is not None, "OpenTelemetryMetrics requires opentelemetry-api"
+            meter = otel_metrics.get_meter(name)
+
+        self.meter = meter
+        self.instruments: Dict[Tuple[str, str], Any] = {}
+
+    def instrument(self, kind: str, name: str) -> Any:
+        instrument = self.instruments.get((kind, name))
+
+        if instrument is None:
+            if kind == "histogram":
+                instrument = self.meter.create_histogram(name)
+            elif kind == "gauge":
+                instrument = self.meter.create_gauge(name)
+            else:
+                instrument = self.meter.create_counter(name)
+
+            self.instruments[(kind, name)] = instrument
+
+        return instrument
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        self.instrument("counter", name).add(value, attributes=labels or None)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self.instrument("histogram", name).record(value, attributes=labels or None)
+
+    def gauge(self, name: str, value: float, **labels: str) -> None:
+        self.instrument("gauge", name).set(value, attributes=labels or None)
+
+
+class CallbackMetrics:
+    def __init__(
+        self,
+        on_increment: Optional[Callback] = None,
+        on_observe: Optional[Callback] = None,
+        on_gauge: Optional[Callback] = None,
+    ) -> None:
+        self.on_increment = on_increment
+        self.on_observe = on_observe
+        self.on_gauge = on_gauge
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        if self.on_increment is not None:
+            self.on_increment(name, value, labels)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if self.on_observe is not None:
+            self.on_observe(name, value, labels)
+
+    def gauge(self, name: str, value: float, **labels: str) -> None:
+        if self.on_gauge is not None:
+            self.on_gauge(name, value, labels)
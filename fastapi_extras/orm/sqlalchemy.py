@@ -1,8 +1,403 @@
-from typing import Any, Generator, Union
+import asyncio
+import base64
+import csv
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import logging
+import pickle
+import random
+import secrets
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    TypeVar,
+    Union,
+)
 
+import anyio
+import anyio.from_thread
+import anyio.to_thread
+from fastapi.responses import StreamingResponse
 from pydantic import AnyUrl
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import Engine, Insert, Select, Table, create_engine, event, insert, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import Connection, Dialect, Result, Row
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import ORMExecuteState, Session, object_mapper, sessionmaker
+from sqlalchemy.orm.loading import merge_frozen_result
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
+from sqlalchemy.sql import ClauseElement, Executable
+from sqlalchemy.sql.util import find_tables
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+
+from fastapi_extras.codecs import Encoded
+from fastapi_extras.databases.memory import Cache, LocalCache, get_many, set_many
+from fastapi_extras.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT_METRIC = "db_pool_checkout_seconds"
+QUERY_METRIC = "db_query_seconds"
+POOL_SIZE_METRIC = "db_pool_size"
+POOL_OVERFLOW_METRIC = "db_pool_overflow"
+POOL_CHECKED_OUT_METRIC = "db_pool_checked_out"
+
+CHECKOUT_WAIT = "checkout_wait"
+
+DEFAULT_QUERY_CACHE_TTL = 60  # seconds
+QUERY_CACHE_OPTION = "query_cache"
+WRITTEN_TABLES = "query_cache_written_tables"
+
+DEFAULT_STREAM_BATCH_SIZE = 1000
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+DEFAULT_BULK_BATCH_SIZE = 1000
+
+ReplicaPolicy = Callable[[Sequence[Engine]], Engine]
+T = TypeVar("T")
+
+
+def redact(parameters: Any) -> Any:
+    if isinstance(parameters, Mapping):
+        return {key: "?" for key in parameters}
+
+    if isinstance(parameters, (list, tuple)):
+        return [
+            redact(value) if isinstance(value, (Mapping, list, tuple)) else "?"
+            for value in parameters
+        ]
+
+    return "?"
+
+
+# No pool event covers the time spent waiting for a connection, so checkout wait time is only
+# recorded by these pools, e.g. Database(url, metrics=metrics, poolclass=TimedQueuePool).
+class TimedQueuePool(QueuePool):
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        record = super()._do_get()
+        record.info[CHECKOUT_WAIT] = time.perf_counter() - started
+        return record
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool, TimedQueuePool):
+    pass
+
+
+def instrument(
+    engine: Engine,
+    metrics: Optional[Metrics] = None,
+    slow_query_threshold: Optional[float] = None,
+    name: str = "primary",
+) -> None:
+    # Nothing is attached unless asked for, so uninstrumented engines pay no per-query cost
+    if metrics is None and slow_query_threshold is None:
+        return
+
+    if metrics is not None:
+
+        def report(pool: Any, returning: int = 0) -> None:
+            if isinstance(pool, QueuePool):
+                overflow = pool.overflow()
+
+                # A returned connection only closes (and frees an overflow slot) on a full pool
+                if returning and 0 < pool.size() <= pool.checkedin():
+                    overflow -= returning
+
+                metrics.gauge(POOL_SIZE_METRIC, pool.size(), database=name)
+                metrics.gauge(POOL_OVERFLOW_METRIC, max(overflow, 0), database=name)
+                metrics.gauge(POOL_CHECKED_OUT_METRIC, pool.checkedout() - returning, database=name)
+
+        def checkout(_: Any, record: ConnectionPoolEntry, __: Any) -> None:
+            wait = record.info.pop(CHECKOUT_WAIT, None)
+
+            if wait is not None:
+                metrics.observe(CHECKOUT_METRIC, wait, database=name)
+
+            report(engine.pool)
+
+        # Pool events are kept across dispose() and fire on engine.pool, whichever pool that is.
+        # The checkin event fires before the connection is handed back, hence the adjustment.
+        event.listen(engine, "checkout", checkout)
+        event.listen(engine, "checkin", lambda *_: report(engine.pool, returning=1))
+
+    def before_cursor_execute(*args: Any) -> None:
+        context = args[4]
+
+        if context is not None:
+            context.query_started = time.perf_counter()
+
+    def after_cursor_execute(*args: Any) -> None:
+        _, _, statement, parameters, context, _ = args
+        started = getattr(context, "query_started", None)
+
+        if started is None:
+            return
+
+        elapsed = time.perf_counter() - started
+
+        if metrics is not None:
+            operation = statement.split(None, 1)[0].upper() if statement.strip() else ""
+            metrics.observe(QUERY_METRIC, elapsed, database=name, operation=operation)
+
+        if slow_query_threshold is not None and elapsed >= slow_query_threshold:
+            logger.warning(
+                "Slow query on %s (%.3fs): %s; parameters: %s",
+                name,
+                elapsed,
+                statement,
+                redact(parameters),
+            )
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+class QueryCache:
+    def __init__(
+        self,
+        cache: Optional[Cache] = None,
+        ttl: Optional[int] = DEFAULT_QUERY_CACHE_TTL,
+        namespace: str = "query",
+        secret_key: Union[str, bytes, None] = None,
+    ) -> None:
+        # Cached results are pickles, so entries in a shared cache are signed and only loaded
+        # when the signature matches: whoever can write to Redis must not get to run code here.
+        assert (
+            cache is None or isinstance(cache, LocalCache) or secret_key is not None
+        ), "QueryCache needs a secret_key to sign entries in a shared cache"
+
+        if isinstance(secret_key, str):
+            secret_key = secret_key.encode()
+
+        self.cache: Cache = LocalCache() if cache is None else cache
+        self.ttl = ttl
+        self.namespace = namespace
+        self.secret_key = secrets.token_bytes(32) if secret_key is None else secret_key
+        # Sync sessions run in threadpool workers, which must not mutate a LocalCache at once
+        self.lock = threading.Lock()
+
+    # Session events are synchronous: the in-process cache is used directly, async sessions
+    # await inside SQLAlchemy's greenlet and sync sessions hop back to the event loop from the
+    # threadpool worker they run in.
+    def reachable(self) -> bool:
+        # Only AnyIO worker threads (e.g. sync endpoints) can hand a call back to the event loop,
+        # a sync session in an async endpoint or a script has no way to await an async cache.
+        return (
+            isinstance(self.cache, LocalCache)
+            or in_greenlet()
+            or hasattr(anyio.from_thread.threadlocals, "current_token")
+        )
+
+    def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if in_greenlet():
+            return await_only(func(self.cache, *args))
+
+        return anyio.from_thread.run(func, self.cache, *args)
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Encoded]]:
+        if isinstance(self.cache, LocalCache):
+            with self.lock:
+                return [self.cache.get_nowait(key) for key in keys]
+
+        return self.run(get_many, keys)
+
+    def set_many(self, mapping: Mapping[str, Encoded], ttl: Optional[int]) -> None:
+        if isinstance(self.cache, LocalCache):
+            with self.lock:
+                for key, value in mapping.items():
+                    self.cache.set_nowait(key, value, ttl)
+        else:
+            self.run(set_many, mapping, ttl)
+
+    def sign(self, payload: bytes) -> bytes:
+        return hmac.new(self.secret_key, payload, hashlib.sha256).digest()
+
+    # Base64 text round-trips through every cache, including Redis clients that decode responses
+    def dumps(self, frozen: Any) -> bytes:
+        payload = pickle.dumps(frozen)
+        return base64.b64encode(self.sign(payload) + payload)
+
+    def loads(self, value: Encoded) -> Any:
+        try:
+            signed = base64.b64decode(value, validate=True)
+        except ValueError:
+            signed = b""
+
+        signature, payload = signed[:32], signed[32:]
+
+        if not payload or not hmac.compare_digest(signature, self.sign(payload)):
+            logger.warning("Query cache entry has an invalid signature, ignoring it")
+            return None
+
+        return pickle.loads(payload)
+
+    def tag(self, table: str) -> str:
+        return f"{self.namespace}:tag:{table}"
+
+    def versions(self, tables: Sequence[str]) -> List[Encoded]:
+        versions = self.get_many([self.tag(table) for table in tables])
+        missing = {
+            self.tag(table): secrets.token_hex(8) for table, v in zip(tables, versions) if v is None
+        }
+
+        # A tag that was never set (or was evicted) gets a fresh version, so entries cached
+        # under an older version of the table can never be served again.
+        if missing:
+            self.set_many(missing, None)
+
+        return [
+            v if v is not None else missing[self.tag(table)] for table, v in zip(tables, versions)
+        ]
+
+    def invalidate(self, tables: Sequence[str]) -> None:
+        if not tables:
+            return
+
+        if not self.reachable():
+            logger.warning("Query cache is unreachable, tables not invalidated: %s", tables)
+            return
+
+        self.set_many({self.tag(table): secrets.token_hex(8) for table in tables}, None)
+
+    def key(self, state: ORMExecuteState, dialect: Dialect, tables: Sequence[str]) -> str:
+        compiled = state.statement.compile(dialect=dialect)
+        parameters = {**compiled.params, **(state.parameters or {})}
+        seed = json.dumps(
+            [str(compiled), sorted(parameters.items()), self.versions(tables)],
+            default=repr,
+            separators=(",", ":"),
+        )
+
+        return f"{self.namespace}:" + hashlib.sha256(seed.encode()).hexdigest()
+
+    def execute(self, state: ORMExecuteState, dialect: Dialect) -> Optional[Result[Any]]:
+        written: Set[str] = state.session.info.setdefault(WRITTEN_TABLES, set())
+
+        if state.is_insert or state.is_update or state.is_delete:
+            written.add(state.statement.table.name)
+            return None
+
+        option = state.execution_options.get(QUERY_CACHE_OPTION)
+
+        if not state.is_select or not option:
+            return None
+
+        if not self.reachable():
+            logger.warning("Query cache is unreachable, running the query uncached")
+            return None
+
+        tables = sorted({table.name for table in find_tables(state.statement, include_joins=True)})
+
+        # Uncommitted writes in this session must be visible to its own reads
+        if written.intersection(tables):
+            return None
+
+        ttl = self.ttl if option is True else option
+        key = self.key(state, dialect, tables)
+        value = self.get_many([key])[0]
+        frozen = None if value is None else self.loads(value)
+
+        if frozen is None:
+            frozen = state.invoke_statement().freeze()
+            self.set_many({key: self.dumps(frozen)}, ttl)
+            return frozen()
+
+        return merge_frozen_result(state.session, state.statement, frozen, load=False)()
+
+    def after_flush(self, session: Session, *_: Any) -> None:
+        written: Set[str] = session.info.setdefault(WRITTEN_TABLES, set())
+
+        for instance in [*session.new, *session.dirty, *session.deleted]:
+            written.update(table.name for table in object_mapper(instance).tables)
+
+    def after_commit(self, session: Session) -> None:
+        self.invalidate(sorted(session.info.pop(WRITTEN_TABLES, ())))
+
+    def after_rollback(self, session: Session) -> None:
+        session.info.pop(WRITTEN_TABLES, None)
+
+    def attach(self, target: Any, dialect: Dialect) -> None:
+        event.listen(target, "do_orm_execute", lambda state: self.execute(state, dialect))
+        event.listen(target, "after_flush", self.after_flush)
+        event.listen(target, "after_commit", self.after_commit)
+        event.listen(target, "after_rollback", self.after_rollback)
+
+
+def _connect(engine: Engine, health_check: bool) -> Connection:
+    connection = engine.connect()
+
+    try:
+        if health_check:
+            connection.execute(text("SELECT 1"))
+    except BaseException:
+        connection.close()
+        raise
+
+    return connection
+
+
+class RoutingSession(Session):
+    def __init__(self, database: "Database", **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.database = database
+        self.pinned = False
+
+    def pin(self) -> None:
+        self.pinned = True
+
+    def get_bind(
+        self,
+        mapper: Optional[Any] = None,
+        *,
+        clause: Optional[ClauseElement] = None,
+        **kwargs: Any,
+    ) -> Engine:
+        if (
+            not self.pinned
+            and not self._flushing
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+            and self.database.replicas
+        ):
+            return self.database.choose_replica()
+
+        # Once a session has written (or locked rows) it keeps reading from the primary, so it
+        # never observes a replica that has not caught up with its own changes yet.
+        if self.database.read_your_writes:
+            self.pinned = True
+
+        return self.database.engine
+
+
+def _reject_flush(session: Session, *_: Any) -> None:
+    if session.info.get("read_only"):
+        raise InvalidRequestError("This session is read-only")
 
 
 class Database:
@@ -11,17 +406,491 @@ class Database:
         database_url: Union[str, AnyUrl],
         autocommit: bool = False,
         autoflush: bool = False,
+        replica_urls: Sequence[Union[str, AnyUrl]] = (),
+        policy: Union[str, ReplicaPolicy] = "round_robin",
+        read_your_writes: bool = True,
+        metrics: Optional[Metrics] = None,
+        slow_query_threshold: Optional[float] = None,
+        query_cache: Optional[QueryCache] = None,
+        min_connections: int = 0,
+        health_check: bool = True,
         **kwargs: Any,
     ) -> None:
+        assert callable(policy) or policy in ("round_robin", "random"), f"Unknown policy: {policy}"
         self.engine = create_engine(str(database_url), **kwargs)
+        self.replicas = [create_engine(str(url), **kwargs) for url in replica_urls]
+        instrument(self.engine, metrics, slow_query_threshold)
+
+        for i, replica in enumerate(self.replicas):
+            instrument(replica, metrics, slow_query_threshold, name=f"replica-{i}")
+
+        self.policy = policy
+        self.read_your_writes = read_your_writes
+        self.min_connections = min_connections
+        self.health_check = health_check
+        self.cycle = itertools.cycle(self.replicas)
         self.sessionmaker = sessionmaker(
             autocommit=autocommit, autoflush=autoflush, bind=self.engine
         )
+        self.routing_sessionmaker = sessionmaker(
+            class_=RoutingSession, autocommit=autocommit, autoflush=autoflush, database=self
+        )
+        self.readonly_sessionmaker = sessionmaker(
+            autocommit=autocommit, autoflush=autoflush, info={"read_only": True}
+        )
+        event.listen(self.readonly_sessionmaker, "before_flush", _reject_flush)
+
+        if query_cache is not None:
+            for maker in (self.sessionmaker, self.routing_sessionmaker, self.readonly_sessionmaker):
+                query_cache.attach(maker, self.engine.dialect)
+
+    def choose_replica(self) -> Engine:
+        if not self.replicas:
+            return self.engine
+
+        if callable(self.policy):
+            return self.policy(self.replicas)
+
+        if self.policy == "random":
+            return random.choice(self.replicas)
+
+        return next(self.cycle)
 
     def __call__(self) -> Generator[Session, None, None]:
+        session = self.routing_sessionmaker() if self.replicas else self.sessionmaker()
+
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def reader(self) -> Generator[Session, None, None]:
+        session = self.readonly_sessionmaker(bind=self.choose_replica())
+
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def writer(self) -> Generator[Session, None, None]:
         session = self.sessionmaker()
 
         try:
             yield session
         finally:
             session.close()
+
+    def bulk_insert(
+        self, table: Any, rows: Iterable[Mapping[str, Any]], **kwargs: Any
+    ) -> "BulkWriteResult":
+        with self.sessionmaker() as session, session.begin():
+            return bulk_insert(session, table, rows, **kwargs)
+
+    async def startup(self) -> None:
+        connections = max(self.min_connections, int(self.health_check))
+        engines = [self.engine, *self.replicas]
+        opened = await asyncio.gather(
+            *(
+                anyio.to_thread.run_sync(_connect, engine, self.health_check)
+                for engine in engines
+                for _ in range(connections)
+            ),
+            return_exceptions=True,
+        )
+
+        for connection in opened:
+            if not isinstance(connection, BaseException):
+                connection.close()
+
+        errors = [error for error in opened if isinstance(error, BaseException)]
+
+        if errors:
+            raise errors[0]
+
+    async def shutdown(self) -> None:
+        for engine in [self.engine, *self.replicas]:
+            engine.dispose()
+
+    @asynccontextmanager
+    async def lifespan(self, _app: Any) -> AsyncIterator[None]:
+        await self.startup()
+
+        try:
+            yield
+        finally:
+            await self.shutdown()
+
+
+class AsyncDatabase:
+    def __init__(
+        self,
+        database_url: Union[str, AnyUrl],
+        autoflush: bool = False,
+        expire_on_commit: bool = False,
+        health_check: bool = True,
+        metrics: Optional[Metrics] = None,
+        slow_query_threshold: Optional[float] = None,
+        query_cache: Optional[QueryCache] = None,
+        min_connections: int = 0,
+        **kwargs: Any,
+    ) -> None:
+        self.engine = create_async_engine(str(database_url), **kwargs)
+        instrument(self.engine.sync_engine, metrics, slow_query_threshold)
+        sync_session_class = Session
+
+        # Session events have to be registered on the sync class the AsyncSession wraps; a
+        # dedicated subclass keeps them from leaking to every other Session in the process.
+        if query_cache is not None:
+            sync_session_class = type("QueryCachedSession", (Session,), {})
+            query_cache.attach(sync_session_class, self.engine.dialect)
+
+        # Expiring on commit would turn the next attribute access into implicit (and, under
+        # asyncio, forbidden) lazy I/O, so committed objects stay loaded by default.
+        self.sessionmaker = async_sessionmaker(
+            autoflush=autoflush,
+            expire_on_commit=expire_on_commit,
+            bind=self.engine,
+            sync_session_class=sync_session_class,
+        )
+        self.health_check = health_check
+        self.min_connections = min_connections
+
+    async def __call__(self) -> AsyncGenerator[AsyncSession, None]:
+        async with self.sessionmaker() as session:
+            yield session
+
+    async def bulk_insert(
+        self,
+        table: Any,
+        rows: Union[Iterable[Mapping[str, Any]], AsyncIterable[Mapping[str, Any]]],
+        **kwargs: Any,
+    ) -> "BulkWriteResult":
+        async with self.sessionmaker() as session, session.begin():
+            return await async_bulk_insert(session, table, rows, **kwargs)
+
+    async def connect(self) -> AsyncConnection:
+        connection = await self.engine.connect()
+
+        try:
+            if self.health_check:
+                await connection.execute(text("SELECT 1"))
+        except BaseException:
+            await connection.close()
+            raise
+
+        return connection
+
+    async def startup(self) -> None:
+        # Connections are held together until all are open, so each one is a distinct pooled
+        # connection rather than the same one checked out and returned repeatedly.
+        connections = max(self.min_connections, int(self.health_check))
+        opened = await asyncio.gather(
+            *(self.connect() for _ in range(connections)), return_exceptions=True
+        )
+
+        for connection in opened:
+            if not isinstance(connection, BaseException):
+                await connection.close()
+
+        errors = [error for error in opened if isinstance(error, BaseException)]
+
+        if errors:
+            raise errors[0]
+
+    async def shutdown(self) -> None:
+        await self.engine.dispose()
+
+    @asynccontextmanager
+    async def lifespan(self, _app: Any) -> AsyncIterator[None]:
+        await self.startup()
+
+        try:
+            yield
+        finally:
+            await self.shutdown()
+
+
+RowFactory = Callable[[Row[Any]], Mapping[str, Any]]
+
+
+class RowEncoder:
+    def __init__(self, format: str, row_factory: RowFactory) -> None:
+        assert format in STREAM_MEDIA_TYPES, f"Unknown format: {format}"
+        self.format = format
+        self.row_factory = row_factory
+        self.header = format == "csv"
+
+    def __call__(self, rows: Sequence[Row[Any]]) -> bytes:
+        records = [self.row_factory(row) for row in rows]
+
+        if self.format == "ndjson":
+            return b"".join(json.dumps(record, default=str).encode() + b"\n" for record in records)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        if self.header and records:
+            writer.writerow(records[0].keys())
+            self.header = False
+
+        writer.writerows(record.values() for record in records)
+        return buffer.getvalue().encode()
+
+
+def _stream_sync(
+    database: Database, statement: Executable, batch_size: int, encode: RowEncoder
+) -> Iterator[bytes]:
+    with database.sessionmaker() as session:
+        result = session.execute(
+            statement.execution_options(stream_results=True, yield_per=batch_size)
+        )
+
+        for rows in result.partitions(batch_size):
+            yield encode(rows)
+
+
+async def _stream(
+    database: Union[Database, "AsyncDatabase"],
+    statement: Executable,
+    batch_size: int,
+    encode: RowEncoder,
+) -> AsyncIterator[bytes]:
+    if isinstance(database, AsyncDatabase):
+        session = database.sessionmaker()
+
+        try:
+            result = await session.stream(
+                statement.execution_options(stream_results=True, yield_per=batch_size)
+            )
+
+            async for rows in result.partitions(batch_size):
+                yield encode(rows)
+        finally:
+            # Also runs when the client disconnects and the response task is cancelled
+            with anyio.CancelScope(shield=True):
+                await session.close()
+
+        return
+
+    # Starlette would run a sync iterator in the threadpool too, but never closes it when the
+    # client goes away, leaving the session and its server-side cursor open until collected.
+    iterator = _stream_sync(database, statement, batch_size, encode)
+    done = object()
+
+    try:
+        while True:
+            chunk = await anyio.to_thread.run_sync(next, iterator, done)
+
+            if chunk is done:
+                break
+
+            yield chunk
+    finally:
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(iterator.close)
+
+
+def stream_results(
+    database: Union[Database, "AsyncDatabase"],
+    statement: Executable,
+    format: str = "ndjson",
+    batch_size: int = DEFAULT_STREAM_BATCH_SIZE,
+    filename: Optional[str] = None,
+    row_factory: RowFactory = lambda row: row._asdict(),
+    headers: Optional[Dict[str, str]] = None,
+) -> StreamingResponse:
+    encode = RowEncoder(format, row_factory)
+    headers = dict(headers or {})
+
+    if filename is not None:
+        headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+    return StreamingResponse(
+        _stream(database, statement, batch_size, encode),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+
+class BatchReport(NamedTuple):
+    index: int
+    rows: int
+    seconds: float
+
+
+class BulkWriteResult(NamedTuple):
+    rows: int
+    batches: List[BatchReport]
+
+
+BatchCallback = Callable[[BatchReport], None]
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    assert size > 0, "size must be positive"
+    iterator = iter(items)
+
+    while True:
+        batch = list(itertools.islice(iterator, size))
+
+        if not batch:
+            return
+
+        yield batch
+
+
+async def abatched(
+    items: Union[Iterable[T], AsyncIterable[T]], size: int
+) -> AsyncIterator[List[T]]:
+    if not isinstance(items, AsyncIterable):
+        for batch in batched(items, size):
+            yield batch
+
+        return
+
+    assert size > 0, "size must be positive"
+    batch: List[T] = []
+
+    async for item in items:
+        batch.append(item)
+
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def upsert_statement(
+    dialect: Dialect,
+    table: Table,
+    columns: Iterable[str],
+    on_conflict: Optional[str] = None,
+    conflict_columns: Optional[Sequence[str]] = None,
+    update_columns: Optional[Sequence[str]] = None,
+) -> Insert:
+    assert on_conflict in (None, "ignore", "update"), f"Unknown on_conflict: {on_conflict}"
+
+    if on_conflict is None:
+        return insert(table)
+
+    index = list(conflict_columns or [column.name for column in table.primary_key])
+    # Only columns present in the rows are overwritten, so omitted columns keep their values
+    # instead of being reset to their insert defaults.
+    updates = list(update_columns or [name for name in columns if name not in index])
+
+    if dialect.name in ("postgresql", "sqlite"):
+        module = postgresql if dialect.name == "postgresql" else sqlite
+        statement = module.insert(table)
+
+        if on_conflict == "ignore" or not updates:
+            return statement.on_conflict_do_nothing(index_elements=index)
+
+        return statement.on_conflict_do_update(
+            index_elements=index, set_={name: statement.excluded[name] for name in updates}
+        )
+
+    if dialect.name in ("mysql", "mariadb"):
+        statement = mysql.insert(table)
+
+        if on_conflict == "ignore" or not updates:
+            return statement.prefix_with("IGNORE")
+
+        return statement.on_duplicate_key_update(
+            {name: statement.inserted[name] for name in updates}
+        )
+
+    raise NotImplementedError(f"Upserts are not supported on {dialect.name}")
+
+
+class BulkWriter:
+    def __init__(
+        self,
+        dialect: Dialect,
+        table: Any,
+        on_conflict: Optional[str] = None,
+        conflict_columns: Optional[Sequence[str]] = None,
+        update_columns: Optional[Sequence[str]] = None,
+        on_batch: Optional[BatchCallback] = None,
+    ) -> None:
+        self.dialect = dialect
+        self.table: Table = getattr(table, "__table__", table)
+        self.on_conflict = on_conflict
+        self.conflict_columns = conflict_columns
+        self.update_columns = update_columns
+        self.on_batch = on_batch
+        self.rows = 0
+        self.batches: List[BatchReport] = []
+
+    def statement(self, batch: List[Mapping[str, Any]]) -> Insert:
+        return upsert_statement(
+            self.dialect,
+            self.table,
+            batch[0].keys(),
+            self.on_conflict,
+            self.conflict_columns,
+            self.update_columns,
+        )
+
+    def record(self, batch: List[Mapping[str, Any]], result: Any, started: float) -> None:
+        rowcount = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else -1
+        report = BatchReport(
+            index=len(self.batches),
+            rows=rowcount if rowcount >= 0 else len(batch),
+            seconds=time.perf_counter() - started,
+        )
+        self.rows += report.rows
+        self.batches.append(report)
+
+        if self.on_batch is not None:
+            self.on_batch(report)
+
+    def result(self) -> BulkWriteResult:
+        return BulkWriteResult(rows=self.rows, batches=self.batches)
+
+
+def bulk_insert(
+    session: Session,
+    table: Any,
+    rows: Iterable[Mapping[str, Any]],
+    batch_size: int = DEFAULT_BULK_BATCH_SIZE,
+    on_conflict: Optional[str] = None,
+    conflict_columns: Optional[Sequence[str]] = None,
+    update_columns: Optional[Sequence[str]] = None,
+    on_batch: Optional[BatchCallback] = None,
+) -> BulkWriteResult:
+    writer = BulkWriter(
+        session.get_bind().dialect, table, on_conflict, conflict_columns, update_columns, on_batch
+    )
+
+    # A list of parameter sets is sent as one executemany (batched into multi-row VALUES by
+    # insertmanyvalues where the dialect supports it): one round trip per batch.
+    for batch in batched(rows, batch_size):
+        started = time.perf_counter()
+        result = session.execute(writer.statement(batch), batch)
+        writer.record(batch, result, started)
+
+    return writer.result()
+
+
+async def async_bulk_insert(
+    session: AsyncSession,
+    table: Any,
+    rows: Union[Iterable[Mapping[str, Any]], AsyncIterable[Mapping[str, Any]]],
+    batch_size: int = DEFAULT_BULK_BATCH_SIZE,
+    on_conflict: Optional[str] = None,
+    conflict_columns: Optional[Sequence[str]] = None,
+    update_columns: Optional[Sequence[str]] = None,
+    on_batch: Optional[BatchCallback] = None,
+) -> BulkWriteResult:
+    writer = BulkWriter(
+        session.get_bind().dialect, table, on_conflict, conflict_columns, update_columns, on_batch
+    )
+
+    async for batch in abatched(rows, batch_size):
+        started = time.perf_counter()
+        result = await session.execute(writer.statement(batch), batch)
+        writer.record(batch, result, started)
+
+    return writer.result()
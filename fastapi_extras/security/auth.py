@@ -1,8 +1,25 @@
 import hashlib
-import json
+import inspect
 import logging
+import time
 import typing
-from typing import Any, AsyncGenerator, Awaitable, Callable, Optional, Protocol, Union
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import httpx
 from fastapi import Depends, HTTPException, Request, status
@@ -10,27 +27,68 @@ from fastapi.security import APIKeyCookie, APIKeyHeader, APIKeyQuery
 from pydantic import AnyHttpUrl
 from typing_extensions import Annotated
 
+try:
+    import jwt
+except ImportError:  # pragma: no cover
+    jwt = None
+
+from fastapi_extras.codecs import Codec, Encoded, get_codec
+from fastapi_extras.concurrency import (
+    CircuitBreaker,
+    CircuitOpenError,
+    MicroBatcher,
+    SingleFlight,
+    TaskSet,
+)
+from fastapi_extras.databases.memory import (  # noqa: F401
+    BatchCache,
+    Cache,
+    LocalCache,
+    TieredCache,
+    get_many,
+    set_many,
+)
+from fastapi_extras.metrics import Metrics
+
 logger = logging.getLogger(__name__)
 ssl_context = httpx.create_ssl_context()
 
 UNAUTHORIZED = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 DEFAULT_SCHEME = APIKeyHeader(name="Authorization")
 DEFAULT_CACHE_TTL = 60  # seconds
+DEFAULT_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+DEFAULT_HTTP_TIMEOUT = httpx.Timeout(5.0)
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_BATCH_WINDOW = 0.005  # seconds
+DEFAULT_MAX_PENDING_WRITES = 1024
+
+CACHE_METRIC = "authorizer_cache_results"
+PHASE_METRIC = "authorizer_phase_seconds"
+REMOTE_METRIC = "authorizer_remote_responses"
+DEFAULT_JWT_ALGORITHMS = ("RS256",)
+DEFAULT_JWKS_TTL = 300  # seconds
+DEFAULT_JWKS_MIN_REFRESH = 10  # seconds
 
 
 def DEFAULT_CACHE_GEN() -> None:
     pass
 
 
-@typing.runtime_checkable
-class Cache(Protocol):
-    async def get(self, key: str) -> Optional[str]: ...
-    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None: ...
+Authorizer = Callable[[Request, str, Optional[Cache]], Awaitable[Any]]
+CacheGenerator = Callable[..., Union[Cache, AsyncGenerator[Cache, None], None]]
+
+
+class ManagedAuthorizer(Protocol):
+    cache_gen: CacheGenerator
+
+    async def __call__(self, request: Request, token: str, cache: Optional[Cache]) -> Any: ...
+    async def startup(self) -> None: ...
+    async def shutdown(self) -> None: ...
+    def lifespan(self, app: Any) -> typing.AsyncContextManager[None]: ...
 
 
 APIKeyScheme = Union[APIKeyCookie, APIKeyHeader, APIKeyQuery]
-Authorizer = Callable[[Request, str, Optional[Cache]], Awaitable[Any]]
-CacheGenerator = Callable[..., Union[Cache, AsyncGenerator[Cache, None], None]]
+Projection = Union[bool, Collection[str]]
 
 
 def keygen(seed: str, prefix: str = "") -> str:
@@ -38,17 +96,302 @@ def keygen(seed: str, prefix: str = "") -> str:
     return f"{prefix}{hash}"
 
 
+def _is_generator_dependency(dependency: Callable[..., Any]) -> bool:
+    call = dependency if inspect.isroutine(dependency) else dependency.__call__
+    return inspect.isasyncgenfunction(call) or inspect.isgeneratorfunction(call)
+
+
+def _project(values: Mapping[str, str], projection: Projection) -> Dict[str, str]:
+    if projection is True:
+        return dict(values)
+
+    return {name: values[name] for name in projection if name in values}
+
+
+class _SharedClient:
+    # Shared by every request handled by an authorizer, so connections are kept alive instead of
+    # being reopened on each request. Injected clients are owned by the caller and never closed.
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        limits: httpx.Limits = DEFAULT_HTTP_LIMITS,
+        timeout: httpx.Timeout = DEFAULT_HTTP_TIMEOUT,
+        http2: bool = False,
+    ) -> None:
+        self.injected = client
+        self.client = client
+        self.limits = limits
+        self.timeout = timeout
+        self.http2 = http2
+
+    def get(self) -> httpx.AsyncClient:
+        if self.client is None or (self.injected is None and self.client.is_closed):
+            self.client = httpx.AsyncClient(
+                verify=ssl_context, limits=self.limits, timeout=self.timeout, http2=self.http2
+            )
+
+        return self.client
+
+    async def aclose(self) -> None:
+        if self.injected is None and self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+def _bind_lifecycle(
+    authorizer: Callable[..., Any],
+    startup: Callable[[], Awaitable[None]],
+    shutdown: Callable[[], Awaitable[None]],
+    cache_gen: CacheGenerator,
+) -> ManagedAuthorizer:
+    @asynccontextmanager
+    async def lifespan(_app: Any) -> AsyncIterator[None]:
+        await startup()
+
+        try:
+            yield
+        finally:
+            await shutdown()
+
+    authorizer.cache_gen = cache_gen  # type: ignore[attr-defined]
+    authorizer.startup = startup  # type: ignore[attr-defined]
+    authorizer.shutdown = shutdown  # type: ignore[attr-defined]
+    authorizer.lifespan = lifespan  # type: ignore[attr-defined]
+
+    return typing.cast(ManagedAuthorizer, authorizer)
+
+
 def remote_authorization(
     url: Union[str, AnyHttpUrl],
     *,
     scheme: APIKeyScheme = DEFAULT_SCHEME,
     cache_gen: CacheGenerator = DEFAULT_CACHE_GEN,
     cache_ttl: int = DEFAULT_CACHE_TTL,
+    client: Optional[httpx.AsyncClient] = None,
+    limits: httpx.Limits = DEFAULT_HTTP_LIMITS,
+    timeout: httpx.Timeout = DEFAULT_HTTP_TIMEOUT,
+    http2: bool = False,
+    local_cache: Optional[LocalCache] = None,
+    coalesce: bool = True,
+    refresh_after: Optional[int] = None,
+    max_stale: Optional[int] = None,
+    denial_ttl: Optional[int] = None,
+    error_ttl: int = 0,
+    breaker: Optional[CircuitBreaker] = None,
+    batch_url: Union[str, AnyHttpUrl, None] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_window: float = DEFAULT_BATCH_WINDOW,
+    forward_headers: Projection = True,
+    forward_cookies: Projection = True,
+    forward_query_params: Projection = True,
+    codec: Union[str, Codec] = "auto",
+    write_behind: bool = False,
+    max_pending_writes: int = DEFAULT_MAX_PENDING_WRITES,
+    metrics: Optional[Metrics] = None,
+    background_cache: Optional[Callable[[], Cache]] = None,
     **kwargs: Any,
-) -> Authorizer:
+) -> ManagedAuthorizer:
     assert isinstance(scheme, (APIKeyCookie, APIKeyHeader, APIKeyQuery)), "Invalid APIKeyScheme"
     # TODO: validate cachegen argument using introspection and type annotations
 
+    # Refreshes and write-behind writes run after the response is sent, when a yield dependency
+    # has already torn its cache down, so they need a long-lived one
+    # (e.g. lambda: redis_manager.client).
+    assert (
+        (refresh_after is None and not write_behind)
+        or background_cache is not None
+        or not _is_generator_dependency(cache_gen)
+    ), "refresh_after and write_behind need background_cache when cache_gen is a yield dependency"
+
+    if isinstance(codec, str):
+        codec = get_codec(codec)
+
+    if not isinstance(forward_headers, bool):
+        forward_headers = tuple(name.lower() for name in forward_headers)
+
+    denial_ttl = cache_ttl if denial_ttl is None else denial_ttl
+
+    # Local entries must never outlive the shared cache, otherwise a worker could keep
+    # authorizing a token long after every other worker has dropped it.
+    local_ttl = cache_ttl if local_cache is None or local_cache.ttl is None else local_cache.ttl
+    local_ttl = min(local_ttl, cache_ttl)
+
+    http_client = _SharedClient(client, limits=limits, timeout=timeout, http2=http2)
+
+    async def startup() -> None:
+        http_client.get()
+
+    async def shutdown() -> None:
+        if batcher is not None:
+            await batcher.drain()
+
+        await tasks.drain()
+        await writes.drain()
+        await http_client.aclose()
+
+    # Concurrent misses for the same key share a single remote call (and cache write) per worker.
+    flights: SingleFlight[Tuple[bool, Any]] = SingleFlight()
+    tasks = TaskSet()
+    writes = TaskSet(limit=max_pending_writes)
+
+    def describe(request: Request) -> Dict[str, Any]:
+        info: Dict[str, Any] = {"method": request.method, "path": request.url.path}
+
+        if forward_query_params is not False:
+            info["query_params"] = _project(request.query_params, forward_query_params)
+
+        if forward_headers is not False:
+            info["headers"] = _project(request.headers, forward_headers)
+
+        if forward_cookies is not False:
+            info["cookies"] = _project(request.cookies, forward_cookies)
+
+        return info
+
+    def detach(cache: Cache) -> Cache:
+        if background_cache is None:
+            return cache
+
+        remote = background_cache()
+        return remote if local_cache is None else TieredCache(local_cache, remote, ttl=local_ttl)
+
+    async def store(cache: Optional[Cache], key: str, entry: Dict[str, Any], ttl: int) -> None:
+        if ttl <= 0 or cache is None:
+            return
+
+        # Entries carry their own soft expiry (wall clock, so it is shared across workers); once
+        # it passes, the decision is still served while a refresh runs in the background.
+        if refresh_after is not None:
+            entry["expires_at"] = time.time() + refresh_after
+
+        value = codec.dumps(entry)
+
+        # Write-behind takes the cache round trip off the request; failed and dropped writes
+        # are counted by the task set and only cost a later cache miss.
+        if write_behind:
+            writes.spawn(cache_set(detach(cache), key, value, ttl))
+            return
+
+        try:
+            await cache_set(cache, key, value, ttl)
+        except Exception as cache_error:
+            logger.warning("Cache set failed, proceeding without cache: %s", cache_error)
+
+    async def cache_set(cache: Cache, key: str, value: Encoded, ttl: int) -> None:
+        if metrics is None:
+            return await cache.set(key, value, ttl)
+
+        started = time.perf_counter()
+
+        try:
+            await cache.set(key, value, ttl)
+        finally:
+            metrics.observe(PHASE_METRIC, time.perf_counter() - started, phase="cache_set")
+
+    async def post(info: Dict[str, Any]) -> Tuple[int, Any]:
+        response = await http_client.get().post(str(url), json=info, **kwargs)
+        return response.status_code, None if response.is_server_error else response.json()
+
+    # Batch endpoint contract: the body is {"requests": [info, ...]} and a 200 response must be
+    # {"results": [{"status": <int>, "context": <any>}, ...]}, one result per request, in order.
+    # Each result is handled exactly as a standalone response with that status and JSON body.
+    async def post_batch(infos: List[Dict[str, Any]]) -> List[Tuple[int, Any]]:
+        response = await http_client.get().post(str(batch_url), json={"requests": infos}, **kwargs)
+        response.raise_for_status()
+
+        try:
+            results = [
+                (int(item["status"]), item.get("context")) for item in response.json()["results"]
+            ]
+        except (KeyError, TypeError, ValueError) as error:
+            raise httpx.DecodingError(
+                f"Malformed batch response: {error}", request=response.request
+            )
+
+        if len(results) != len(infos):
+            raise httpx.DecodingError(
+                f"Expected {len(infos)} batch results, got {len(results)}", request=response.request
+            )
+
+        return results
+
+    batcher = None
+
+    if batch_url is not None:
+        batcher = MicroBatcher(post_batch, max_size=batch_size, window=batch_window)
+
+    async def fetch(
+        info: Dict[str, Any], key: str, cache: Optional[Cache], refreshing: bool = False
+    ) -> Tuple[bool, Any]:
+        # A failed refresh must not overwrite the stale decision, which is served until max_stale
+        failure_ttl = 0 if refreshing else error_ttl
+
+        if breaker is not None and not breaker.allow():
+            if metrics is not None:
+                metrics.increment(REMOTE_METRIC, status="circuit_open")
+
+            raise CircuitOpenError(url)
+
+        started = time.perf_counter() if metrics is not None else 0.0
+
+        try:
+            if batcher is not None:
+                status_code, context = await batcher.submit(info)
+            else:
+                status_code, context = await post(info)
+        except httpx.HTTPError as http_error:
+            logger.error(http_error)
+
+            if metrics is not None:
+                metrics.observe(PHASE_METRIC, time.perf_counter() - started, phase="remote")
+                metrics.increment(REMOTE_METRIC, status="error")
+
+            if breaker is not None:
+                breaker.record_failure()
+
+            await store(cache, key, {"authorized": False, "context": None}, failure_ttl)
+            raise UNAUTHORIZED
+        except Exception:
+            # An unreadable response is a failure too: a half-open probe that never reports back
+            # would hold its slot forever and the breaker would deny every request from then on.
+            if breaker is not None:
+                breaker.record_failure()
+
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+
+            raise
+
+        if metrics is not None:
+            metrics.observe(PHASE_METRIC, time.perf_counter() - started, phase="remote")
+            metrics.increment(REMOTE_METRIC, status=str(status_code))
+
+        if status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+            logger.error("Authorization request failed with status %s", status_code)
+
+            if breaker is not None:
+                breaker.record_failure()
+
+            await store(cache, key, {"authorized": False, "context": None}, failure_ttl)
+            return False, None
+
+        if breaker is not None:
+            breaker.record_success()
+
+        authorized = status_code == status.HTTP_200_OK
+        ttl = cache_ttl if authorized else denial_ttl
+
+        await store(cache, key, {"authorized": authorized, "context": context}, ttl)
+        return authorized, context
+
+    async def refresh(info: Dict[str, Any], key: str, cache: Optional[Cache]) -> None:
+        try:
+            await flights.do(key, lambda: fetch(info, key, cache, refreshing=True))
+        except (CircuitOpenError, HTTPException):
+            pass  # already logged by fetch, the stale decision is still being served
+
     async def authorizer(
         request: Request,
         token: Annotated[str, Depends(scheme)],
@@ -56,50 +399,198 @@ def remote_authorization(
     ) -> Any:
         key = keygen(token, prefix="authorizer:")
 
+        if local_cache is not None:
+            cache = TieredCache(local_cache, cache, ttl=local_ttl)
+
+        started = time.perf_counter() if metrics is not None else 0.0
+
         cached = None
         try:
             cached = await cache.get(key)
         except Exception as cache_error:
             logger.warning("Cache get failed, proceeding without cache: %s", cache_error)
 
+        if metrics is not None:
+            metrics.observe(PHASE_METRIC, time.perf_counter() - started, phase="cache_get")
+            started = time.perf_counter()
+
         if cached:
-            cached = json.loads(cached)
+            try:
+                cached = codec.loads(cached)
+            except Exception as codec_error:
+                logger.warning("Cache entry is unreadable, ignoring it: %s", codec_error)
+                cached = None
+
+            if metrics is not None:
+                metrics.observe(PHASE_METRIC, time.perf_counter() - started, phase="decode")
+
+        decision: Optional[Tuple[bool, Any]] = None
+        fallback: Optional[Tuple[bool, Any]] = None
+        staleness = 0.0
 
         if cached and isinstance(cached, dict):
-            if not cached.get("authorized"):
-                raise UNAUTHORIZED
+            expires_at = cached.get("expires_at")
+            staleness = 0.0 if expires_at is None else time.time() - expires_at
 
-            request.scope["authorizer"] = cached.get("context")
-            return request.scope["authorizer"]
+            if max_stale is None or staleness < max_stale:
+                # At most one refresh per cache key, whichever request happened to find it stale
+                if staleness > 0 and key not in flights:
+                    tasks.spawn(refresh(describe(request), key, detach(cache)))
 
-        info = {
-            "method": request.method,
-            "path": request.url.path,
-            "query_params": dict(request.query_params),
-            "headers": dict(request.headers),
-            "cookies": request.cookies,
-        }
+                decision = bool(cached.get("authorized")), cached.get("context")
+            else:
+                fallback = bool(cached.get("authorized")), cached.get("context")
+
+        if metrics is not None:
+            result = "miss" if decision is None else "hit" if staleness <= 0 else "stale"
+            metrics.increment(CACHE_METRIC, result=result)
+
+        if decision is None:
+            info = describe(request)
 
-        async with httpx.AsyncClient(verify=ssl_context) as client:
             try:
-                response = await client.post(str(url), json=info, **kwargs)
-            except httpx.HTTPError as http_error:
-                logger.error(http_error)
+                # One remote call per cache key: the decision is cached under the token alone,
+                # so callers sharing a flight get exactly what they would read from the cache.
+                if coalesce:
+                    decision = await flights.do(key, lambda: fetch(info, key, cache))
+                else:
+                    decision = await fetch(info, key, cache)
+            except CircuitOpenError:
+                # The auth service is known to be down: fail fast, or fall back to a decision
+                # that is too stale to be served otherwise.
+                if fallback is None:
+                    raise UNAUTHORIZED
+
+                decision = fallback
+
+        authorized, context = decision
+
+        if not authorized:
+            raise UNAUTHORIZED
+
+        request.scope["authorizer"] = context
+        return request.scope["authorizer"]
+
+    authorizer.writes = writes  # type: ignore[attr-defined]
+
+    return _bind_lifecycle(authorizer, startup, shutdown, cache_gen)
+
+
+def jwt_authorization(
+    jwks_url: Union[str, AnyHttpUrl],
+    *,
+    scheme: APIKeyScheme = DEFAULT_SCHEME,
+    algorithms: Sequence[str] = DEFAULT_JWT_ALGORITHMS,
+    audience: Union[str, Sequence[str], None] = None,
+    issuer: Optional[str] = None,
+    leeway: float = 0,
+    jwks_ttl: int = DEFAULT_JWKS_TTL,
+    jwks_min_refresh: int = DEFAULT_JWKS_MIN_REFRESH,
+    fallback: Optional[ManagedAuthorizer] = None,
+    cache_gen: CacheGenerator = DEFAULT_CACHE_GEN,
+    client: Optional[httpx.AsyncClient] = None,
+    limits: httpx.Limits = DEFAULT_HTTP_LIMITS,
+    timeout: httpx.Timeout = DEFAULT_HTTP_TIMEOUT,
+    http2: bool = False,
+    **kwargs: Any,
+) -> ManagedAuthorizer:
+    assert jwt is not None, "jwt_authorization requires PyJWT: pip install fastapi-ext-pkg[jwt]"
+    assert isinstance(scheme, (APIKeyCookie, APIKeyHeader, APIKeyQuery)), "Invalid APIKeyScheme"
+
+    # The cache only ever reaches the fallback, so it is resolved through the fallback's own
+    # dependency rather than configured a second time.
+    if fallback is not None and cache_gen is DEFAULT_CACHE_GEN:
+        cache_gen = fallback.cache_gen
+
+    assert fallback is None or cache_gen is fallback.cache_gen, "cache_gen must match the fallback"
+
+    http_client = _SharedClient(client, limits=limits, timeout=timeout, http2=http2)
+    flights: SingleFlight[None] = SingleFlight()
+    keys: Dict[Optional[str], Any] = {}
+    checked_at = float("-inf")  # last successful refresh
+    attempted_at = float("-inf")  # last refresh, failed or not
+    min_refresh = min(jwks_min_refresh, jwks_ttl)
+
+    async def load_keys() -> None:
+        nonlocal keys, checked_at, attempted_at
+
+        attempted_at = time.monotonic()
+
+        try:
+            response = await http_client.get().get(str(jwks_url), **kwargs)
+            response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+        except (httpx.HTTPError, jwt.PyJWKSetError, ValueError) as error:
+            # Keep serving the previous key set; the expired checked_at retries it soon
+            logger.error("JWKS refresh failed: %s", error)
+        else:
+            keys = {key.key_id: key for key in jwk_set.keys}
+            checked_at = attempted_at
+
+    async def get_key(kid: Optional[str]) -> Any:
+        now = time.monotonic()
+
+        # Expired key sets and unknown key ids (e.g. right after a key rotation) force a refresh,
+        # throttled by the last attempt so that tokens with bogus ids or a JWKS outage cannot
+        # hammer the endpoint.
+        if now - attempted_at >= min_refresh and (now - checked_at >= jwks_ttl or kid not in keys):
+            await flights.do("jwks", load_keys)
+
+        return keys.get(kid)
+
+    async def startup() -> None:
+        await flights.do("jwks", load_keys)
+
+        if fallback is not None:
+            await fallback.startup()
+
+    async def shutdown() -> None:
+        await http_client.aclose()
+
+        if fallback is not None:
+            await fallback.shutdown()
+
+    async def authorizer(
+        request: Request,
+        token: Annotated[str, Depends(scheme)],
+        cache: Annotated[Optional[Cache], Depends(cache_gen)],
+    ) -> Any:
+        credentials = token[7:] if token[:7].lower() == "bearer " else token
+
+        try:
+            header = jwt.get_unverified_header(credentials)
+        except jwt.DecodeError:
+            header = {}
+
+        algorithm = header.get("alg")
+        key = await get_key(header.get("kid")) if algorithm in algorithms else None
+
+        if key is None:
+            if fallback is None:
                 raise UNAUTHORIZED
-            else:
-                authorized = response.status_code == status.HTTP_200_OK
-                context = response.json()
 
-                try:
-                    value = json.dumps({"authorized": authorized, "context": context})
-                    await cache.set(key, value, cache_ttl)
-                except Exception as cache_error:
-                    logger.warning("Cache set failed, proceeding without cache: %s", cache_error)
+            return await fallback(request, token, cache)
 
-                if not authorized:
-                    raise UNAUTHORIZED
+        # The header is unauthenticated: a key is only ever used with the algorithm it was
+        # published for, never with one from another family (e.g. an RSA key for ES256).
+        if key.algorithm_name != algorithm:
+            logger.info("Invalid JWT: %s does not match key %s", algorithm, key.key_id)
+            raise UNAUTHORIZED
+
+        try:
+            claims = jwt.decode(
+                credentials,
+                key.key,
+                algorithms=[algorithm],
+                audience=audience,
+                issuer=issuer,
+                leeway=leeway,
+            )
+        except jwt.PyJWTError as token_error:
+            logger.info("Invalid JWT: %s", token_error)
+            raise UNAUTHORIZED
 
-                request.scope["authorizer"] = context
-                return request.scope["authorizer"]
+        request.scope["authorizer"] = claims
+        return request.scope["authorizer"]
 
-    return authorizer
+    return _bind_lifecycle(authorizer, startup, shutdown, cache_gen)
@@ -0,0 +1,192 @@
+from typing import Dict, Optional
+
+import anyio
+import pytest
+
+from fastapi_extras.databases.memory import BatchCache, LocalCache, TieredCache, get_many, set_many
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeCache:
+    def __init__(self):
+        self.db: Dict[str, str] = {}
+        self.gets = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        self.gets += 1
+        return self.db.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None):
+        self.db[key] = value
+
+
+def test_local_cache_ttl():
+    clock = Clock()
+    cache = LocalCache(ttl=10, timer=clock)
+
+    cache.set_nowait("foo", "bar")
+    cache.set_nowait("bar", "baz", ttl=60)
+    cache.set_nowait("baz", "foo", ttl=5)
+
+    clock.now = 6
+    assert cache.get_nowait("foo") == "bar"
+    assert cache.get_nowait("baz") is None
+
+    clock.now = 10
+    assert cache.get_nowait("foo") is None
+    assert cache.get_nowait("bar") is None
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_local_cache_lru_eviction():
+    cache = LocalCache(maxsize=2)
+
+    cache.set_nowait("foo", "1")
+    cache.set_nowait("bar", "2")
+    assert cache.get_nowait("foo") == "1"
+
+    cache.set_nowait("baz", "3")
+    assert cache.get_nowait("bar") is None
+    assert cache.get_nowait("foo") == "1"
+    assert cache.get_nowait("baz") == "3"
+
+
+def test_local_cache_memory_bound():
+    cache = LocalCache(maxbytes=16)
+
+    cache.set_nowait("foo", "12345")
+    cache.set_nowait("bar", "12345")
+    cache.set_nowait("baz", "12345")
+
+    assert len(cache) == 2
+    assert cache.nbytes == 16
+    assert cache.get_nowait("foo") is None
+
+    cache.set_nowait("bar", "1")
+    assert cache.nbytes == 12
+
+    cache.set_nowait("big", "x" * 32)
+    assert len(cache) == 0
+
+    cache.set_nowait("foo", "bar", ttl=0)
+    assert cache.get_nowait("foo") is None
+
+    cache.set_nowait("foo", "bar")
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+    assert not cache.evict("foo")
+
+
+def test_tiered_cache_falls_through():
+    async def main():
+        clock = Clock()
+        local = LocalCache(ttl=60, timer=clock)
+        remote = FakeCache()
+        cache = TieredCache(local, remote, ttl=10)
+
+        remote.db["foo"] = "bar"
+        assert await cache.get("foo") == "bar"
+        assert await cache.get("foo") == "bar"
+        assert remote.gets == 1
+
+        clock.now = 10
+        assert await cache.get("foo") == "bar"
+        assert remote.gets == 2
+
+        assert await cache.get("baz") is None
+        assert remote.gets == 3
+
+        await cache.set("baz", "foo", ttl=5)
+        assert remote.db["baz"] == "foo"
+        assert await local.get("baz") == "foo"
+
+        clock.now = 15
+        assert local.get_nowait("baz") is None
+
+        local_only = TieredCache(local)
+        await local_only.set("qux", "quux")
+        await local.set("grault", "garply", ttl=1)
+        assert await local.get("grault") == "garply"
+        assert await local_only.get("qux") == "quux"
+        assert await local_only.get("corge") is None
+
+    anyio.run(main)
+
+
+class FakeBatchCache(FakeCache):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    async def get_many(self, keys):
+        self.batches.append(list(keys))
+        return [self.db.get(key) for key in keys]
+
+    async def set_many(self, mapping, ttl=None):
+        self.batches.append(dict(mapping))
+        self.db.update(mapping)
+
+
+def test_local_cache_batch_operations():
+    async def main():
+        clock = Clock()
+        cache = LocalCache(timer=clock)
+
+        await cache.set_many({"foo": "1", "bar": "2"}, ttl={"foo": 5})
+        assert await cache.get_many(["foo", "bar", "baz"]) == ["1", "2", None]
+
+        clock.now = 5
+        assert await cache.get_many(["foo", "bar"]) == [None, "2"]
+
+    anyio.run(main)
+
+
+@pytest.mark.parametrize("remote_class", [FakeCache, FakeBatchCache])
+def test_tiered_cache_batch_operations(remote_class):
+    async def main():
+        local = LocalCache()
+        remote = remote_class()
+        cache = TieredCache(local, remote, ttl=10)
+
+        remote.db.update({"foo": "1", "bar": "2"})
+        local.set_nowait("bar", "local")
+
+        assert await cache.get_many(["foo", "bar", "baz"]) == ["1", "local", None]
+        assert await cache.get_many(["foo", "bar"]) == ["1", "local"]
+        assert local.get_nowait("foo") == "1"
+
+        await cache.set_many({"baz": "3", "qux": "4"}, ttl=60)
+        assert remote.db["baz"] == "3"
+        assert local.entries["qux"][0] <= local.timer() + 10
+
+        local_only = TieredCache(local)
+        await local_only.set_many({"quux": "5"})
+        assert await local_only.get_many(["quux", "corge"]) == ["5", None]
+
+        return remote
+
+    remote = anyio.run(main)
+
+    if isinstance(remote, FakeBatchCache):
+        assert remote.batches == [["foo", "baz"], {"baz": "3", "qux": "4"}]
+
+
+@pytest.mark.parametrize("cache_class", [FakeCache, FakeBatchCache, LocalCache])
+def test_cache_batch_helpers(cache_class):
+    cache = cache_class()
+
+    async def main():
+        await set_many(cache, {"foo": "1", "bar": "2"}, ttl={"foo": 60})
+        return await get_many(cache, ["foo", "bar", "baz"])
+
+    assert anyio.run(main) == ["1", "2", None]
+    assert isinstance(cache, BatchCache) == (cache_class is not FakeCache)
@@ -1,13 +1,43 @@
-from typing import List
+import asyncio
+import csv
+import io
+import json
+import pickle
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+import anyio
+import anyio.to_thread
+import pytest
 from fastapi import Depends, FastAPI, status
 from fastapi.testclient import TestClient
 from pydantic import BaseModel
-from sqlalchemy import Column, DateTime, StaticPool, String, text
+from sqlalchemy import Column, DateTime, StaticPool, String, event, select, text, update
+from sqlalchemy.dialects import mysql, oracle, postgresql
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from typing_extensions import Annotated
 
-from fastapi_extras.orm.sqlalchemy import Database
+from fastapi_extras.databases.memory import LocalCache
+from fastapi_extras.metrics import CallbackMetrics
+from fastapi_extras.orm.sqlalchemy import (
+    AsyncDatabase,
+    BatchReport,
+    Database,
+    QueryCache,
+    RoutingSession,
+    TimedAsyncAdaptedQueuePool,
+    TimedQueuePool,
+    abatched,
+    batched,
+    bulk_insert,
+    redact,
+    stream_results,
+    upsert_statement,
+)
 
 app = FastAPI()
 
@@ -69,3 +99,700 @@ def test_items():
     response = client.get("/items/")
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == items
+
+
+async_db = AsyncDatabase("sqlite+aiosqlite://", poolclass=StaticPool)
+
+
+@asynccontextmanager
+async def async_lifespan(app: FastAPI) -> AsyncIterator[None]:
+    async with async_db.lifespan(app):
+        async with async_db.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        yield
+
+
+async_app = FastAPI(lifespan=async_lifespan)
+
+
+@async_app.post("/items/", response_model=ItemSchema, status_code=status.HTTP_201_CREATED)
+async def async_create_item(item: ItemSchema, session: Annotated[AsyncSession, Depends(async_db)]):
+    db_item = Item(**item.model_dump())
+    session.add(db_item)
+    await session.commit()
+    return db_item
+
+
+@async_app.get("/items/", response_model=List[ItemSchema])
+async def async_read_items(session: Annotated[AsyncSession, Depends(async_db)]):
+    result = await session.execute(select(Item.key, Item.value).order_by(Item.timestamp))
+    return result.all()
+
+
+def test_async_items():
+    items = [
+        {"key": "foo", "value": "bar"},
+        {"key": "bar", "value": "baz"},
+    ]
+
+    with TestClient(async_app) as async_client:
+        for item in items:
+            response = async_client.post("/items/", json=item)
+            assert response.status_code == status.HTTP_201_CREATED
+            assert response.json() == item
+
+        response = async_client.get("/items/")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == items
+
+
+def test_async_database_health_check(tmp_path: Path):
+    async def main():
+        for health_check in (True, False):
+            path = tmp_path / f"{health_check}.sqlite3"
+            database = AsyncDatabase(f"sqlite+aiosqlite:///{path}", health_check=health_check)
+
+            await database.startup()
+            assert path.exists() is health_check
+            await database.shutdown()
+
+    asyncio.run(main())
+
+
+def replicated_database(**kwargs: Any) -> Database:
+    database = Database(
+        "sqlite://",
+        replica_urls=["sqlite://", "sqlite://"],
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+        **kwargs,
+    )
+
+    for name, engine in [("primary", database.engine)] + [
+        (f"replica-{i}", replica) for i, replica in enumerate(database.replicas)
+    ]:
+        Base.metadata.create_all(engine)
+
+        with Session(engine) as session:
+            session.add(Item(key="source", value=name))
+            session.commit()
+
+    return database
+
+
+def source(session: Session) -> str:
+    return session.scalars(select(Item.value).where(Item.key == "source")).one()
+
+
+def test_database_routing():
+    database = replicated_database()
+    session = next(database())
+
+    assert [source(session) for _ in range(3)] == ["replica-0", "replica-1", "replica-0"]
+    assert session.query(Item.value).filter(Item.key == "source").scalar() == "replica-1"
+
+    locked = session.scalars(select(Item.value).where(Item.key == "source").with_for_update())
+    assert locked.one() == "primary"
+    assert source(session) == "primary"
+
+    session = next(database())
+    session.add(Item(key="foo", value="bar"))
+    session.commit()
+
+    assert session.get(Item, "foo").value == "bar"
+    assert source(session) == "primary"
+
+    session = next(database())
+    session.pin()
+    assert source(session) == "primary"
+
+
+def test_database_routing_without_read_your_writes():
+    database = replicated_database(read_your_writes=False, policy="random")
+    session = next(database())
+
+    session.execute(text("UPDATE items SET value = value"))
+    assert source(session).startswith("replica-")
+
+    session.add(Item(key="foo", value="bar"))
+    session.commit()
+    assert source(session).startswith("replica-")
+
+
+def test_database_reader_and_writer():
+    database = replicated_database(policy=lambda replicas: replicas[-1])
+    reader = next(database.reader())
+    writer = next(database.writer())
+
+    assert source(reader) == "replica-1"
+    assert source(writer) == "primary"
+
+    reader.add(Item(key="foo", value="bar"))
+
+    with pytest.raises(InvalidRequestError):
+        reader.commit()
+
+    writer.add(Item(key="foo", value="bar"))
+    writer.commit()
+
+
+def test_database_without_replicas():
+    database = Database("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(database.engine)
+
+    assert database.choose_replica() is database.engine
+    assert not isinstance(next(database()), RoutingSession)
+    assert next(database.reader()).get_bind() is database.engine
+
+    with pytest.raises(AssertionError):
+        Database("sqlite://", policy="least_connections")
+
+
+def test_database_instrumentation(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+    observations: List[Tuple[str, float, Dict[str, str]]] = []
+    gauges: Dict[Tuple[str, str], float] = {}
+    metrics = CallbackMetrics(
+        on_observe=lambda name, value, labels: observations.append((name, value, labels)),
+        on_gauge=lambda name, value, labels: gauges.update({(name, labels["database"]): value}),
+    )
+    database = Database(
+        f"sqlite:///{tmp_path / 'primary.sqlite3'}",
+        replica_urls=[f"sqlite:///{tmp_path / 'replica.sqlite3'}"],
+        metrics=metrics,
+        slow_query_threshold=0,
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+    )
+    Base.metadata.create_all(database.engine)
+
+    with database.engine.connect() as first, database.engine.connect():
+        assert gauges[("db_pool_checked_out", "primary")] == 2
+        assert gauges[("db_pool_overflow", "primary")] == 1
+        first.execute(text("SELECT :secret"), {"secret": "hunter2"})
+
+    assert gauges[("db_pool_checked_out", "primary")] == 0
+    assert gauges[("db_pool_overflow", "primary")] == 0
+    assert gauges[("db_pool_size", "primary")] == 1
+
+    session = next(database())
+    session.add_all([Item(key="foo", value="bar"), Item(key="bar", value="baz")])
+    session.commit()
+    session.close()
+
+    database.engine.dispose()
+
+    with database.engine.connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+        assert gauges[("db_pool_checked_out", "primary")] == 1
+
+    assert gauges[("db_pool_checked_out", "primary")] == 0
+
+    with database.replicas[0].connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+
+    names = {
+        (name, labels.get("database"), labels.get("operation")) for name, _, labels in observations
+    }
+
+    assert ("db_pool_checkout_seconds", "primary", None) in names
+    assert ("db_pool_checkout_seconds", "replica-0", None) in names
+    assert ("db_query_seconds", "primary", "SELECT") in names
+    assert ("db_query_seconds", "primary", "INSERT") in names
+    assert ("db_query_seconds", "replica-0", "SELECT") in names
+    assert len([name for name, *_ in observations if name == "db_pool_checkout_seconds"]) >= 4
+
+    messages = [record.getMessage() for record in caplog.records]
+
+    assert "SELECT ?; parameters: ['?']" in messages[-4]
+    assert messages[-3].endswith("parameters: [['?', '?'], ['?', '?']]")
+    assert not any("hunter2" in message for message in messages)
+
+
+@pytest.mark.parametrize("pool_size", [0, 1, 2])
+def test_database_pool_gauges(tmp_path: Path, pool_size: int):
+    gauges: Dict[str, float] = {}
+    observations: List[str] = []
+    metrics = CallbackMetrics(
+        on_observe=lambda name, *_: observations.append(name),
+        on_gauge=lambda name, value, _: gauges.update({name: value}),
+    )
+    # A plain QueuePool: gauges only, there is no public hook for checkout wait time
+    database = Database(
+        f"sqlite:///{tmp_path / 'pool.sqlite3'}",
+        metrics=metrics,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=2,
+    )
+    pool = database.engine.pool
+    connections = [database.engine.connect() for _ in range(2)]
+
+    # Reported at checkin, before the pool has taken the connection back, yet they must match
+    # what the pool reports once it has
+    for connection in connections:
+        connection.close()
+        assert gauges["db_pool_checked_out"] == pool.checkedout()
+        assert gauges["db_pool_overflow"] == max(pool.overflow(), 0)
+
+    assert "db_pool_checkout_seconds" not in observations
+
+
+def test_async_database_checkout_wait():
+    observations: List[Tuple[str, Dict[str, str]]] = []
+    database = AsyncDatabase(
+        "sqlite+aiosqlite://",
+        metrics=CallbackMetrics(
+            on_observe=lambda name, _, labels: observations.append((name, labels))
+        ),
+        poolclass=TimedAsyncAdaptedQueuePool,
+    )
+
+    async def main():
+        async with database.engine.connect() as connection:
+            await connection.exec_driver_sql("SELECT 1")
+
+        await database.engine.dispose()
+
+    asyncio.run(main())
+
+    assert ("db_pool_checkout_seconds", {"database": "primary"}) in observations
+
+
+def test_database_slow_query_log_only(caplog: pytest.LogCaptureFixture):
+    database = Database("sqlite://", poolclass=StaticPool, slow_query_threshold=60)
+    fast = Database("sqlite://", poolclass=StaticPool, slow_query_threshold=0)
+
+    for engine in (database.engine, fast.engine):
+        with engine.connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+
+    assert len(caplog.records) == 1
+    assert caplog.records[0].getMessage().endswith("SELECT 1; parameters: []")
+
+    fast.engine.dispatch.after_cursor_execute(None, None, "SELECT 1", (), None, False)
+    assert len(caplog.records) == 1
+
+    assert redact({"secret": "hunter2"}) == {"secret": "?"}
+    assert redact("value") == "?"
+
+
+class DictCache:
+    def __init__(self) -> None:
+        self.db: Dict[str, Any] = {}
+        self.ttls: Dict[str, Optional[int]] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.db.get(key)
+
+    # Stores text, like a Redis client created with decode_responses=True
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        self.db[key] = value.decode() if isinstance(value, bytes) else value
+        self.ttls[key] = ttl
+
+
+def count_queries(engine: Any) -> List[str]:
+    statements: List[str] = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_query_cache():
+    local = LocalCache()
+    database = Database("sqlite://", poolclass=StaticPool, query_cache=QueryCache(local, ttl=30))
+    Base.metadata.create_all(database.engine)
+    statements = count_queries(database.engine)
+    cached = select(Item).where(Item.key == "foo").execution_options(query_cache=True)
+
+    with database.sessionmaker() as session:
+        session.add_all([Item(key="foo", value="bar"), Item(key="bar", value="baz")])
+        session.commit()
+
+    with database.sessionmaker() as session:
+        assert session.scalars(cached).one().value == "bar"
+        assert session.scalars(cached).one().value == "bar"
+        assert session.scalars(cached).one() in session
+        assert session.scalars(select(Item.value).where(Item.key == "bar")).one() == "baz"
+
+    with database.sessionmaker() as session:
+        columns = select(Item.key, Item.value).order_by(Item.key)
+        assert session.execute(columns.execution_options(query_cache=5)).all() == [
+            ("bar", "baz"),
+            ("foo", "bar"),
+        ]
+        assert session.scalars(cached).one().value == "bar"
+
+    assert len(statements) == 4
+
+    # Reads see this session's own uncommitted writes, other sessions keep the cached value
+    with database.sessionmaker() as session, database.sessionmaker() as other:
+        session.scalars(cached).one().value = "qux"
+        session.flush()
+
+        assert session.scalars(cached).one().value == "qux"
+        assert other.scalars(cached).one().value == "bar"
+
+        session.commit()
+
+        assert other.scalars(cached).one().value == "qux"
+
+    with database.sessionmaker() as session:
+        session.execute(update(Item).where(Item.key == "foo").values(value="quux"))
+        session.rollback()
+        assert session.scalars(cached).one().value == "qux"
+
+        session.execute(update(Item).where(Item.key == "foo").values(value="quux"))
+        session.commit()
+        assert session.scalars(cached).one().value == "quux"
+
+    # An evicted tag must not resurrect entries cached under an earlier version
+    with database.sessionmaker() as session:
+        local.evict("query:tag:items")
+        session.scalars(cached).one()
+        assert session.scalars(cached).one().value == "quux"
+
+    ttls = [expires for expires, _ in local.entries.values()]
+
+    assert None in ttls
+    assert len(statements) == 11
+
+
+def test_query_cache_threadpool():
+    cache = DictCache()
+    database = Database(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+        query_cache=QueryCache(cache, secret_key="secret"),
+    )
+    Base.metadata.create_all(database.engine)
+    statements = count_queries(database.engine)
+    cached_app = FastAPI()
+
+    @cached_app.post("/items/", status_code=status.HTTP_201_CREATED)
+    def create(item: ItemSchema, session: Annotated[Session, Depends(database)]):
+        session.add(Item(**item.model_dump()))
+        session.commit()
+
+    @cached_app.get("/items/{key}")
+    def read(key: str, session: Annotated[Session, Depends(database.reader)]):
+        query = select(Item.value).where(Item.key == key).execution_options(query_cache=10)
+        return session.scalars(query).one_or_none()
+
+    cached_client = TestClient(cached_app)
+    cached_client.post("/items/", json={"key": "foo", "value": "bar"})
+
+    assert [cached_client.get("/items/foo").json() for _ in range(3)] == ["bar"] * 3
+    assert len([statement for statement in statements if statement.startswith("SELECT")]) == 1
+    assert sorted(set(cache.ttls.values()), key=str) == [10, None]
+
+    cached_client.post("/items/", json={"key": "bar", "value": "baz"})
+
+    assert cached_client.get("/items/foo").json() == "bar"
+    assert len([statement for statement in statements if statement.startswith("SELECT")]) == 2
+
+
+def test_query_cache_signed_entries(caplog: pytest.LogCaptureFixture):
+    with pytest.raises(AssertionError):
+        QueryCache(DictCache())
+
+    cache = DictCache()
+    database = Database(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+        query_cache=QueryCache(cache, secret_key="secret"),
+    )
+    Base.metadata.create_all(database.engine)
+    statements = count_queries(database.engine)
+    cached = select(Item.value).execution_options(query_cache=True)
+
+    async def main():
+        # Sync sessions reach an async cache from a threadpool worker
+        return await anyio.to_thread.run_sync(lambda: database.sessionmaker().scalars(cached).all())
+
+    assert anyio.run(main) == []
+
+    # Tampered or foreign entries are never unpickled, the query just runs again
+    key = next(key for key in cache.db if ":tag:" not in key)
+    forged = QueryCache(DictCache(), secret_key="other").dumps([])
+
+    for value in ["not base64!", pickle.dumps([]).hex(), forged.decode()]:
+        cache.db[key] = value
+        assert anyio.run(main) == []
+
+    assert len(statements) == 4
+    assert caplog.text.count("invalid signature") == 3
+
+    # Outside a worker thread there is no event loop to hand the cache call to, so the cache is
+    # skipped rather than failing the query
+    with database.sessionmaker() as session:
+        assert session.scalars(cached).all() == []
+        session.commit()
+        session.add(Item(key="foo", value="bar"))
+        session.commit()
+
+    assert len(statements) == 6
+    assert "running the query uncached" in caplog.text
+    assert "tables not invalidated: ['items']" in caplog.text
+
+
+def test_query_cache_async():
+    cache = DictCache()
+    database = AsyncDatabase(
+        "sqlite+aiosqlite://",
+        poolclass=StaticPool,
+        query_cache=QueryCache(cache, secret_key=b"secret"),
+    )
+    statements = count_queries(database.engine.sync_engine)
+
+    async def main():
+        async with database.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        query = select(Item).where(Item.key == "foo").execution_options(query_cache=True)
+
+        async with database.sessionmaker() as session:
+            session.add(Item(key="foo", value="bar"))
+            await session.commit()
+
+            assert (await session.scalars(query)).one().value == "bar"
+            assert (await session.scalars(query)).one().value == "bar"
+
+        async with database.sessionmaker() as session:
+            assert (await session.scalars(query)).one().value == "bar"
+
+        await database.shutdown()
+
+    asyncio.run(main())
+
+    assert len([statement for statement in statements if statement.startswith("SELECT")]) == 1
+
+
+def test_stream_results(tmp_path: Path):
+    database = Database(f"sqlite:///{tmp_path / 'stream.sqlite3'}")
+    Base.metadata.create_all(database.engine)
+    stream_app = FastAPI()
+
+    with database.sessionmaker() as session:
+        session.add_all([Item(key=f"key-{i:04}", value=f"value,{i}") for i in range(2500)])
+        session.commit()
+
+    query = select(Item.key, Item.value).order_by(Item.key)
+
+    @stream_app.get("/items.ndjson")
+    def export_ndjson():
+        return stream_results(database, query, batch_size=1000)
+
+    @stream_app.get("/items.csv")
+    def export_csv():
+        return stream_results(database, query, format="csv", filename="items.csv")
+
+    @stream_app.get("/empty.csv")
+    def export_empty():
+        return stream_results(database, query.where(Item.key == ""), format="csv")
+
+    @stream_app.get("/entities.ndjson")
+    def export_entities():
+        return stream_results(
+            database,
+            select(Item).order_by(Item.key).limit(2),
+            row_factory=lambda row: {"key": row.Item.key, "timestamp": row.Item.timestamp},
+            headers={"cache-control": "no-store"},
+        )
+
+    stream_client = TestClient(stream_app)
+
+    response = stream_client.get("/items.ndjson")
+    lines = response.content.splitlines()
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert len(lines) == 2500
+    assert json.loads(lines[-1]) == {"key": "key-2499", "value": "value,2499"}
+
+    response = stream_client.get("/items.csv")
+    rows = list(csv.reader(io.StringIO(response.text)))
+
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="items.csv"'
+    assert rows[:2] == [["key", "value"], ["key-0000", "value,0"]]
+    assert len(rows) == 2501
+
+    assert stream_client.get("/empty.csv").content == b""
+
+    response = stream_client.get("/entities.ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+
+    assert response.headers["cache-control"] == "no-store"
+    assert [record["key"] for record in records] == ["key-0000", "key-0001"]
+    assert all(record["timestamp"] for record in records)
+
+    assert database.engine.pool.checkedout() == 0
+
+    with pytest.raises(AssertionError):
+        stream_results(database, query, format="xml")
+
+
+def test_stream_results_disconnect(tmp_path: Path):
+    path = tmp_path / "disconnect.sqlite3"
+    database = Database(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    async_database = AsyncDatabase(f"sqlite+aiosqlite:///{path}", poolclass=AsyncAdaptedQueuePool)
+    Base.metadata.create_all(database.engine)
+
+    with database.sessionmaker() as session:
+        session.add_all([Item(key=f"key-{i}", value="value") for i in range(10)])
+        session.commit()
+
+    query = select(Item.key).order_by(Item.key)
+
+    async def main():
+        for db in (database, async_database):
+            body = stream_results(db, query, batch_size=2).body_iterator
+            first = await body.__anext__()
+
+            assert first == b'{"key": "key-0"}\n{"key": "key-1"}\n'
+            assert db.engine.pool.checkedout() == 1
+
+            # Starlette closes the body iterator when the client goes away mid-stream
+            await body.aclose()
+
+            assert db.engine.pool.checkedout() == 0
+
+        response = stream_results(async_database, query, format="csv", batch_size=4)
+        chunks = [chunk async for chunk in response.body_iterator]
+
+        assert len(chunks) == 3
+        assert chunks[0].splitlines()[:2] == [b"key", b"key-0"]
+
+        await async_database.shutdown()
+
+    asyncio.run(main())
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+    async def numbers():
+        for number in range(5):
+            yield number
+
+    async def main():
+        assert [batch async for batch in abatched(numbers(), 2)] == [[0, 1], [2, 3], [4]]
+        assert [batch async for batch in abatched(numbers(), 5)] == [[0, 1, 2, 3, 4]]
+        assert [batch async for batch in abatched(range(3), 2)] == [[0, 1], [2]]
+
+    asyncio.run(main())
+
+
+def test_bulk_insert(tmp_path: Path):
+    database = Database(f"sqlite:///{tmp_path / 'bulk.sqlite3'}")
+    Base.metadata.create_all(database.engine)
+    reports: List[BatchReport] = []
+    statements = count_queries(database.engine)
+
+    result = database.bulk_insert(
+        Item,
+        ({"key": f"key-{i}", "value": "old"} for i in range(25)),
+        batch_size=10,
+        on_batch=reports.append,
+    )
+
+    assert result.rows == 25
+    assert [batch.rows for batch in result.batches] == [10, 10, 5]
+    assert [batch.index for batch in result.batches] == [0, 1, 2]
+    assert all(batch.seconds >= 0 for batch in result.batches)
+    assert reports == result.batches
+    assert len(statements) == 3
+
+    with database.sessionmaker() as session:
+        timestamp = session.get(Item, "key-0").timestamp
+
+    rows = [{"key": f"key-{i}", "value": "new"} for i in range(20, 30)]
+    result = database.bulk_insert(Item.__table__, rows, on_conflict="update")
+
+    assert result.rows == 10
+
+    with database.sessionmaker() as session:
+        values = dict(session.execute(select(Item.key, Item.value)).all())
+        assert len(values) == 30
+        assert values["key-19"] == "old"
+        assert values["key-20"] == values["key-29"] == "new"
+        # Columns missing from the rows keep their stored values
+        assert session.get(Item, "key-0").timestamp == timestamp
+
+    rows = [{"key": "key-0", "value": "ignored"}, {"key": "key-30", "value": "new"}]
+    result = database.bulk_insert(Item, rows, on_conflict="ignore")
+
+    assert result.rows == 1
+
+    with database.sessionmaker() as session:
+        assert session.get(Item, "key-0").value == "old"
+
+    # A failing batch rolls back with the caller's transaction
+    with pytest.raises(IntegrityError), database.sessionmaker.begin() as session:
+        bulk_insert(
+            session, Item, [{"key": "key-31", "value": "new"}, {"key": "key-0", "value": "new"}]
+        )
+
+    with database.sessionmaker() as session:
+        assert session.get(Item, "key-31") is None
+
+
+def test_bulk_insert_async(tmp_path: Path):
+    database = AsyncDatabase(f"sqlite+aiosqlite:///{tmp_path / 'bulk.sqlite3'}")
+
+    async def rows(value: str):
+        for i in range(15):
+            yield {"key": f"key-{i}", "value": value}
+
+    async def main():
+        async with database.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        result = await database.bulk_insert(Item, rows("old"), batch_size=10)
+
+        assert [batch.rows for batch in result.batches] == [10, 5]
+
+        result = await database.bulk_insert(
+            Item, rows("new"), on_conflict="update", update_columns=["value"]
+        )
+
+        assert result.rows == 15
+
+        async with database.sessionmaker() as session:
+            assert (await session.get(Item, "key-14")).value == "new"
+
+        await database.shutdown()
+
+    asyncio.run(main())
+
+
+def test_upsert_statement():
+    table = Item.__table__
+    columns = ["key", "value"]
+
+    def compile(dialect: Any, *args: Any) -> str:
+        return str(upsert_statement(dialect, table, columns, *args).compile(dialect=dialect))
+
+    statement = compile(postgresql.dialect(), "update")
+    assert "ON CONFLICT (key) DO UPDATE SET value = excluded.value" in statement
+
+    statement = compile(postgresql.dialect(), "ignore", ["value"])
+    assert "ON CONFLICT (value) DO NOTHING" in statement
+
+    statement = compile(mysql.dialect(), "update")
+    assert "ON DUPLICATE KEY UPDATE value = VALUES(value)" in statement
+
+    statement = compile(mysql.dialect(), "update", None, ["key"])
+    assert "ON DUPLICATE KEY UPDATE `key` = VALUES(`key`)" in statement
+
+    assert compile(mysql.dialect(), "ignore").startswith("INSERT IGNORE INTO items")
+    assert "ON CONFLICT" not in compile(postgresql.dialect())
+
+    with pytest.raises(NotImplementedError):
+        compile(oracle.dialect(), "update")
+
+    with pytest.raises(AssertionError):
+        compile(postgresql.dialect(), "replace")
@@ -1,15 +1,26 @@
-from typing import Any, AsyncGenerator, Callable, Dict, Optional
+import asyncio
+import json
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Type
 from unittest.mock import AsyncMock
 
+import jwt
 import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
 from fastapi import Depends, FastAPI, status
+from fastapi import Request as FastAPIRequest
+from fastapi.responses import JSONResponse
 from fastapi.security import APIKeyQuery
 from fastapi.testclient import TestClient
-from httpx import ConnectTimeout, Request, Response, codes
+from httpx import ASGITransport, AsyncClient, ConnectError, ConnectTimeout, Request, Response, codes
 from pydantic import BaseModel
 from pytest import MonkeyPatch
 from typing_extensions import Annotated
 
+from fastapi_extras import codecs
+from fastapi_extras.concurrency import CircuitBreaker
+from fastapi_extras.databases.memory import LocalCache
+from fastapi_extras.metrics import CallbackMetrics
 from fastapi_extras.security import auth
 
 AUTH_URL = "http://auth.test"
@@ -144,6 +155,10 @@ def health_check_broken_set():
     pass
 
 
+async def scope_info(request: FastAPIRequest):
+    return request.scope["authorizer"]
+
+
 appy_client = TestClient(appy)
 appz_client = TestClient(appz)
 app_broken_get_client = TestClient(app_broken_get)
@@ -362,3 +377,908 @@ def test_health_check_when_cache_set_fails(
 
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert httpx_asyncmock.await_count == 2
+
+
+auth_service = FastAPI()
+auth_service_calls = []
+
+
+@auth_service.post("/")
+async def auth_service_authorize(info: Dict[str, Any]):
+    auth_service_calls.append(info)
+    return {"sid": "d4ad3d03-1cbe-40a2-8002-e060a65fede0"}
+
+
+def test_injected_client_is_reused_and_not_closed():
+    auth_service_calls.clear()
+    transport = ASGITransport(app=auth_service)
+    client = AsyncClient(transport=transport)
+    injected_authorizer = auth.remote_authorization(AUTH_URL, client=client)
+
+    app = FastAPI(
+        dependencies=[Depends(injected_authorizer)], lifespan=injected_authorizer.lifespan
+    )
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+
+    with TestClient(app) as app_client:
+        for _ in range(3):
+            response = app_client.get("/health/", headers={"authorization": f"Bearer {USER_KEY}"})
+            assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    assert len(auth_service_calls) == 3
+    assert not client.is_closed
+
+
+def test_owned_client_lifecycle(
+    httpx_asyncmock: AsyncMock, authorized: Callable[..., Response], monkeypatch: MonkeyPatch
+):
+    clients = []
+
+    class TrackedAsyncClient(AsyncClient):
+        def __init__(self, *args: Any, **kwargs: Any):
+            super().__init__(*args, **kwargs)
+            clients.append(self)
+
+    monkeypatch.setattr("httpx.AsyncClient", TrackedAsyncClient)
+    owned_authorizer = auth.remote_authorization(AUTH_URL)
+
+    app = FastAPI(dependencies=[Depends(owned_authorizer)], lifespan=owned_authorizer.lifespan)
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+
+    httpx_asyncmock.return_value = authorized(path="/health/")
+
+    with TestClient(app) as app_client:
+        for _ in range(2):
+            response = app_client.get("/health/", headers={"authorization": f"Bearer {USER_KEY}"})
+            assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    assert httpx_asyncmock.await_count == 2
+    assert len(clients) == 1
+    assert clients[0].is_closed
+
+
+def test_local_cache_skips_shared_cache(
+    httpx_asyncmock: AsyncMock, authorized: Callable[..., Response]
+):
+    headers = {"authorization": f"Bearer {USER_KEY}"}
+    local_cache = LocalCache(ttl=3600)
+    local_authorizer = auth.remote_authorization(
+        AUTH_URL, cache_gen=cache_gen, cache_ttl=30, local_cache=local_cache
+    )
+
+    app = FastAPI(dependencies=[Depends(local_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+    app_client = TestClient(app)
+
+    httpx_asyncmock.return_value = authorized(path="/health/", headers=headers)
+
+    for _ in range(3):
+        response = app_client.get("/health/", headers=headers)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    key = auth.keygen(headers["authorization"], prefix="authorizer:")
+    expires_at, _ = local_cache.entries[key]
+
+    assert httpx_asyncmock.await_count == 1
+    assert cache_gen.cache.hits == 0
+    assert key in cache_gen.cache.db
+    assert expires_at <= local_cache.timer() + 30
+
+
+@auth_service.post("/slow/")
+async def auth_service_authorize_slowly(info: Dict[str, Any]):
+    auth_service_calls.append(info)
+    await asyncio.sleep(0.05)
+
+    if info["headers"]["authorization"] != f"Bearer {USER_KEY}":
+        return JSONResponse({"message": "Invalid credentials"}, status.HTTP_401_UNAUTHORIZED)
+
+    return {"sid": "d4ad3d03-1cbe-40a2-8002-e060a65fede0"}
+
+
+@pytest.mark.parametrize("coalesce, expected_calls", [(True, 2), (False, 10)])
+def test_concurrent_misses_are_coalesced(coalesce: bool, expected_calls: int):
+    auth_service_calls.clear()
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    coalesced_authorizer = auth.remote_authorization(
+        f"{AUTH_URL}/slow/", cache_gen=cache_gen, client=auth_client, coalesce=coalesce
+    )
+
+    app = FastAPI(dependencies=[Depends(coalesced_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            requests = [
+                client.get("/health/", headers={"authorization": f"Bearer {token}"})
+                for token in [USER_KEY] * 5 + ["xoxo"] * 5
+            ]
+            return await asyncio.gather(*requests)
+
+    responses = asyncio.run(main())
+
+    assert [response.status_code for response in responses] == [status.HTTP_204_NO_CONTENT] * 5 + [
+        status.HTTP_401_UNAUTHORIZED
+    ] * 5
+    assert len(auth_service_calls) == expected_calls
+
+
+def test_coalescing_ignores_request_details():
+    auth_service_calls.clear()
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    coalesced_authorizer = auth.remote_authorization(f"{AUTH_URL}/slow/", client=auth_client)
+
+    app = FastAPI(dependencies=[Depends(coalesced_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            return await asyncio.gather(
+                *(
+                    client.get(
+                        "/health/",
+                        headers={"authorization": f"Bearer {USER_KEY}", "x-request-id": str(i)},
+                    )
+                    for i in range(20)
+                )
+            )
+
+    responses = asyncio.run(main())
+
+    # Concurrent misses always differ in some header, they still share one remote call per token
+    assert all(response.status_code == status.HTTP_204_NO_CONTENT for response in responses)
+    assert len(auth_service_calls) == 1
+
+
+@pytest.mark.parametrize("max_stale, expected_calls", [(None, 2), (3600, 2), (0, 3)])
+def test_stale_decisions_are_refreshed_in_background(max_stale: Optional[int], expected_calls: int):
+    auth_service_calls.clear()
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    swr_authorizer = auth.remote_authorization(
+        f"{AUTH_URL}/slow/",
+        cache_gen=lambda: cache_gen.cache,
+        client=auth_client,
+        refresh_after=0,
+        max_stale=max_stale,
+    )
+
+    app = FastAPI(dependencies=[Depends(swr_authorizer)])
+    app.get("/auth-info/")(scope_info)
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            headers = {"authorization": f"Bearer {USER_KEY}"}
+            responses = [await client.get("/auth-info/", headers=headers) for _ in range(2)]
+            await asyncio.sleep(0)
+            responses.append(await client.get("/auth-info/", headers=headers))
+
+        await swr_authorizer.shutdown()
+        return responses
+
+    responses = asyncio.run(main())
+
+    assert all(response.status_code == status.HTTP_200_OK for response in responses)
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert len(auth_service_calls) == expected_calls
+
+
+def test_stale_decision_is_refreshed_once():
+    auth_service_calls.clear()
+    cache = FakeCache()
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    swr_authorizer = auth.remote_authorization(
+        f"{AUTH_URL}/slow/", cache_gen=lambda: cache, client=auth_client, refresh_after=0
+    )
+
+    app = FastAPI(dependencies=[Depends(swr_authorizer)])
+    app.get("/items/{key}", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            headers = {"authorization": f"Bearer {USER_KEY}"}
+            await client.get("/items/0", headers=headers)
+            responses = await asyncio.gather(
+                *(client.get(f"/items/{i}", headers=headers) for i in range(20))
+            )
+
+        await swr_authorizer.shutdown()
+        return responses
+
+    responses = asyncio.run(main())
+
+    # A stale token requested on many paths still costs a single background refresh
+    assert all(response.status_code == status.HTTP_204_NO_CONTENT for response in responses)
+    assert len(auth_service_calls) == 2
+
+
+class ClosingCache(FakeCache):
+    def __init__(self, db: Dict[str, Any]):
+        super().__init__()
+        self.db = db
+        self.closed = False
+
+    async def get(self, key: str) -> Optional[str]:
+        if self.closed:
+            raise ConnectionError("Client already closed")
+
+        return await super().get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None):
+        if self.closed:
+            raise ConnectionError("Client already closed")
+
+        await super().set(key, value, ttl)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class TornDownCache(ClosingCache):
+    # Holds writes until a request's cache has been torn down
+    async def set(self, key: str, value: str, ttl: Optional[int] = None):
+        while not self.db.get("torn_down"):
+            await asyncio.sleep(0.01)
+
+        await super().set(key, value, ttl)
+
+    async def aclose(self):
+        self.db["torn_down"] = True
+        await super().aclose()
+
+
+def closing_cache_gen(
+    db: Dict[str, Any], cache_class: Type[ClosingCache] = ClosingCache
+) -> Callable[[], AsyncGenerator[ClosingCache, None]]:
+    async def generator() -> AsyncGenerator[ClosingCache, None]:
+        cache = cache_class(db)
+
+        try:
+            yield cache
+        finally:
+            await cache.aclose()
+
+    return generator
+
+
+def test_background_refresh_outlives_request_cache():
+    auth_service_calls.clear()
+    db: Dict[str, Any] = {}
+
+    with pytest.raises(AssertionError):
+        auth.remote_authorization(AUTH_URL, cache_gen=closing_cache_gen(db), refresh_after=0)
+
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    swr_authorizer = auth.remote_authorization(
+        f"{AUTH_URL}/slow/",
+        cache_gen=closing_cache_gen(db),
+        client=auth_client,
+        refresh_after=0,
+        local_cache=LocalCache(),
+        background_cache=lambda: ClosingCache(db),
+    )
+
+    app = FastAPI(dependencies=[Depends(swr_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+    key = auth.keygen(f"Bearer {USER_KEY}", prefix="authorizer:")
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            headers = {"authorization": f"Bearer {USER_KEY}"}
+            await client.get("/health/", headers=headers)
+            stored = db[key]
+
+            response = await client.get("/health/", headers=headers)
+            await swr_authorizer.shutdown()
+
+        return stored, response
+
+    stored, response = asyncio.run(main())
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert len(auth_service_calls) == 2
+    assert json.loads(db[key])["expires_at"] > json.loads(stored)["expires_at"]
+
+
+class FlakyTransport(ASGITransport):
+    down = False
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if self.down:
+            raise ConnectError("Connection refused", request=request)
+
+        return await super().handle_async_request(request)
+
+
+@pytest.mark.parametrize("breaker", [None, CircuitBreaker(failure_threshold=1)])
+def test_failed_refresh_keeps_stale_decision(
+    breaker: Optional[CircuitBreaker], caplog: pytest.LogCaptureFixture
+):
+    auth_service_calls.clear()
+    cache = FakeCache()
+    transport = FlakyTransport(app=auth_service)
+    swr_authorizer = auth.remote_authorization(
+        AUTH_URL,
+        cache_gen=lambda: cache,
+        client=AsyncClient(transport=transport),
+        refresh_after=0,
+        max_stale=3600,
+        error_ttl=30,
+        breaker=breaker,
+    )
+
+    app = FastAPI(dependencies=[Depends(swr_authorizer)])
+    app.get("/auth-info/")(scope_info)
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            headers = {"authorization": f"Bearer {USER_KEY}"}
+            responses = [await client.get("/auth-info/", headers=headers)]
+            transport.down = True
+
+            for _ in range(3):
+                responses.append(await client.get("/auth-info/", headers=headers))
+                await asyncio.sleep(0.01)
+
+        await swr_authorizer.shutdown()
+        return responses
+
+    responses = asyncio.run(main())
+
+    assert [response.status_code for response in responses] == [status.HTTP_200_OK] * 4
+    assert json.loads(next(iter(cache.db.values())))["authorized"]
+    assert "Background task failed" not in caplog.text
+
+
+class TTLRecordingCache(FakeCache):
+    def __init__(self):
+        super().__init__()
+        self.ttls = {}
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None):
+        self.db[key] = value
+        self.ttls[key] = ttl
+
+
+def test_decisions_use_their_own_ttl(
+    httpx_asyncmock: AsyncMock, authorized: Callable[..., Response]
+):
+    cache = TTLRecordingCache()
+    ttl_authorizer = auth.remote_authorization(
+        AUTH_URL, cache_gen=lambda: cache, cache_ttl=60, denial_ttl=5, error_ttl=2
+    )
+
+    app = FastAPI(dependencies=[Depends(ttl_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+    app_client = TestClient(app)
+
+    def key(token: str) -> str:
+        return auth.keygen(f"Bearer {token}", prefix="authorizer:")
+
+    httpx_asyncmock.return_value = authorized(path="/health/")
+    app_client.get("/health/", headers={"authorization": f"Bearer {USER_KEY}"})
+
+    httpx_asyncmock.return_value = authorized(path="/health/", is_authorized=False)
+    app_client.get("/health/", headers={"authorization": "Bearer xoxo"})
+
+    httpx_asyncmock.return_value = Response(status_code=codes.SERVICE_UNAVAILABLE, text="down")
+    response = app_client.get("/health/", headers={"authorization": "Bearer oops"})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    httpx_asyncmock.side_effect = ConnectTimeout("Connection timed out")
+    response = app_client.get("/health/", headers={"authorization": "Bearer ouch"})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    assert cache.ttls == {key(USER_KEY): 60, key("xoxo"): 5, key("oops"): 2, key("ouch"): 2}
+
+
+def test_open_breaker_fails_fast(httpx_asyncmock: AsyncMock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=3600)
+    breaker_authorizer = auth.remote_authorization(AUTH_URL, breaker=breaker)
+
+    app = FastAPI(dependencies=[Depends(breaker_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+    app_client = TestClient(app)
+
+    httpx_asyncmock.side_effect = ConnectTimeout("Connection timed out")
+
+    for _ in range(4):
+        response = app_client.get("/health/", headers={"authorization": f"Bearer {USER_KEY}"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    assert httpx_asyncmock.await_count == 2
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_open_breaker_falls_back_to_stale_decision(
+    httpx_asyncmock: AsyncMock, authorized: Callable[..., Response]
+):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=3600)
+    stale_authorizer = auth.remote_authorization(
+        AUTH_URL,
+        cache_gen=cache_gen,
+        refresh_after=0,
+        max_stale=0,
+        breaker=breaker,
+        background_cache=lambda: cache_gen.cache,
+    )
+
+    app = FastAPI(dependencies=[Depends(stale_authorizer)])
+    app.get("/auth-info/")(scope_info)
+    app_client = TestClient(app)
+    headers = {"authorization": f"Bearer {USER_KEY}"}
+
+    httpx_asyncmock.return_value = authorized(path="/auth-info/")
+    response = app_client.get("/auth-info/", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    httpx_asyncmock.return_value = Response(status_code=codes.BAD_GATEWAY, text="down")
+    response = app_client.get("/auth-info/", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert breaker.state == CircuitBreaker.OPEN
+
+    cache_gen.cache.db[auth.keygen(headers["authorization"], prefix="authorizer:")] = json.dumps(
+        {"authorized": True, "context": {"sid": "stale"}, "expires_at": 0}
+    )
+
+    response = app_client.get("/auth-info/", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"sid": "stale"}
+    assert httpx_asyncmock.await_count == 2
+
+
+def test_half_open_probe_always_reports_back(httpx_asyncmock: AsyncMock):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, timer=lambda: now[0])
+    probe_authorizer = auth.remote_authorization(AUTH_URL, breaker=breaker, coalesce=False)
+
+    app = FastAPI(dependencies=[Depends(probe_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+    app_client = TestClient(app, raise_server_exceptions=False)
+    headers = {"authorization": f"Bearer {USER_KEY}"}
+
+    httpx_asyncmock.side_effect = ConnectTimeout("Connection timed out")
+    app_client.get("/health/", headers=headers)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # A probe answered with a body that is not JSON
+    now[0] = 10
+    httpx_asyncmock.side_effect = None
+    httpx_asyncmock.return_value = Response(status_code=codes.UNAUTHORIZED, text="<html>")
+    response = app_client.get("/health/", headers=headers)
+
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # A probe cancelled by a client that went away
+    async def hang(*_args: Any, **_kwargs: Any):
+        await asyncio.Event().wait()
+
+    async def cancelled_probe():
+        scope = {"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": []}
+        request = FastAPIRequest(scope)
+        probe = asyncio.ensure_future(probe_authorizer(request, headers["authorization"], None))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    now[0] = 20
+    httpx_asyncmock.side_effect = hang
+    asyncio.run(cancelled_probe())
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.probes == 0
+
+    httpx_asyncmock.side_effect = None
+    httpx_asyncmock.return_value = Response(status_code=codes.OK, json={"sid": "recovered"})
+    response = app_client.get("/health/", headers=headers)
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+auth_service_batches = []
+
+
+@auth_service.post("/batch/")
+async def auth_service_authorize_batch(batch: Dict[str, Any]):
+    auth_service_batches.append(batch["requests"])
+    results = []
+
+    for info in batch["requests"]:
+        token = info["headers"]["authorization"]
+
+        if token == "Bearer broken":
+            results.append({"status": 503, "context": None})
+        elif token.startswith("Bearer user-"):
+            results.append({"status": 200, "context": {"sid": token}})
+        else:
+            results.append({"status": 401, "context": {"message": "Invalid credentials"}})
+
+    return {"results": results}
+
+
+@auth_service.post("/batch/short/")
+async def auth_service_authorize_batch_short(_batch: Dict[str, Any]):
+    return {"results": []}
+
+
+@auth_service.post("/batch/malformed/")
+async def auth_service_authorize_batch_malformed(_batch: Dict[str, Any]):
+    return {"results": [{"context": 1}]}
+
+
+@pytest.mark.parametrize("batch_size, expected_batches", [(64, [7]), (3, [3, 3, 1])])
+def test_misses_are_batched(batch_size: int, expected_batches: List[int]):
+    auth_service_batches.clear()
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    batch_authorizer = auth.remote_authorization(
+        AUTH_URL,
+        client=auth_client,
+        batch_url=f"{AUTH_URL}/batch/",
+        batch_size=batch_size,
+        batch_window=0.05,
+    )
+
+    app = FastAPI(dependencies=[Depends(batch_authorizer)])
+    app.get("/auth-info/")(scope_info)
+    tokens = [f"user-{i}" for i in range(5)] + ["xoxo", "broken"]
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            requests = [
+                client.get("/auth-info/", headers={"authorization": f"Bearer {token}"})
+                for token in tokens
+            ]
+            responses = await asyncio.gather(*requests)
+
+        await batch_authorizer.shutdown()
+        return responses
+
+    responses = asyncio.run(main())
+
+    assert sorted(len(batch) for batch in auth_service_batches) == sorted(expected_batches)
+
+    for token, response in zip(tokens[:5], responses):
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"sid": f"Bearer {token}"}
+
+    assert [response.status_code for response in responses[5:]] == [
+        status.HTTP_401_UNAUTHORIZED
+    ] * 2
+
+
+@pytest.mark.parametrize("path", ["/batch/short/", "/batch/malformed/"])
+def test_malformed_batch_response_is_an_error(path: str):
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    batch_authorizer = auth.remote_authorization(
+        AUTH_URL, client=auth_client, batch_url=f"{AUTH_URL}{path}"
+    )
+
+    app = FastAPI(dependencies=[Depends(batch_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+
+    response = TestClient(app).get("/health/", headers={"authorization": f"Bearer {USER_KEY}"})
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+jwt_private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+jwt_keys = {"keys": []}
+jwks_calls = []
+
+
+def jwt_encode(claims: Dict[str, Any], kid: str = "k1", algorithm: str = "RS256") -> str:
+    claims = {"sub": "user", "exp": int(time.time()) + 60, **claims}
+    return jwt.encode(claims, jwt_private_key, algorithm=algorithm, headers={"kid": kid})
+
+
+def jwt_publish(*kids: str):
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(jwt_private_key.public_key()))
+    jwt_keys["keys"] = [{**jwk, "kid": kid, "alg": "RS256", "use": "sig"} for kid in kids]
+
+
+@auth_service.get("/jwks/")
+async def auth_service_jwks():
+    jwks_calls.append(1)
+    return jwt_keys
+
+
+@pytest.fixture
+def jwt_app() -> Callable[..., TestClient]:
+    jwks_calls.clear()
+    jwt_publish("k1")
+
+    def builder(**kwargs: Any) -> TestClient:
+        auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+        jwt_authorizer = auth.jwt_authorization(
+            f"{AUTH_URL}/jwks/", client=auth_client, audience="api", **kwargs
+        )
+
+        app = FastAPI(dependencies=[Depends(jwt_authorizer)], lifespan=jwt_authorizer.lifespan)
+        app.get("/auth-info/")(scope_info)
+
+        return TestClient(app)
+
+    return builder
+
+
+def test_jwt_is_verified_locally(jwt_app: Callable[..., TestClient]):
+    token = jwt_encode({"aud": "api", "sid": "s1"})
+
+    with jwt_app() as app_client:
+        for _ in range(3):
+            response = app_client.get("/auth-info/", headers={"authorization": f"Bearer {token}"})
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()["sid"] == "s1"
+
+        for invalid in [
+            jwt_encode({"aud": "other"}),
+            jwt_encode({"aud": "api", "exp": int(time.time()) - 60}),
+            jwt_encode({"aud": "api"}, algorithm="RS384"),
+            token[:-4] + "AAAA",
+            "not-a-jwt",
+        ]:
+            response = app_client.get("/auth-info/", headers={"authorization": invalid})
+            assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    assert len(jwks_calls) == 1
+
+
+def test_jwt_algorithm_must_match_key(jwt_app: Callable[..., TestClient]):
+    ec_key = ec.generate_private_key(ec.SECP256R1())
+    forged = jwt.encode({"aud": "api"}, ec_key, algorithm="ES256", headers={"kid": "k1"})
+
+    with jwt_app(algorithms=("RS256", "ES256")) as app_client:
+        response = app_client.get("/auth-info/", headers={"authorization": forged})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        response = app_client.get(
+            "/auth-info/", headers={"authorization": jwt_encode({"aud": "api"})}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+
+def test_jwt_key_rotation_refreshes_jwks(jwt_app: Callable[..., TestClient]):
+    with jwt_app(jwks_min_refresh=0) as app_client:
+        jwt_publish("k1", "k2")
+        token = jwt_encode({"aud": "api"}, kid="k2")
+
+        response = app_client.get("/auth-info/", headers={"authorization": token})
+        assert response.status_code == status.HTTP_200_OK
+
+        response = app_client.get("/auth-info/", headers={"authorization": token})
+        assert response.status_code == status.HTTP_200_OK
+
+    assert len(jwks_calls) == 2
+
+
+def test_jwt_keeps_keys_when_jwks_refresh_fails(jwt_app: Callable[..., TestClient]):
+    token = jwt_encode({"aud": "api"})
+
+    with jwt_app(jwks_ttl=0) as app_client:
+        jwt_keys["keys"] = "broken"
+
+        response = app_client.get("/auth-info/", headers={"authorization": token})
+        assert response.status_code == status.HTTP_200_OK
+
+    assert len(jwks_calls) == 2
+
+
+def test_jwt_refresh_is_throttled_while_jwks_is_down(jwt_app: Callable[..., TestClient]):
+    jwt_keys["keys"] = "broken"
+    token = jwt_encode({"aud": "api"}, kid="bogus")
+
+    with jwt_app() as app_client:
+        for _ in range(20):
+            response = app_client.get("/auth-info/", headers={"authorization": token})
+            assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    assert len(jwks_calls) == 1
+
+
+def test_jwt_falls_back_to_remote_authorization(jwt_app: Callable[..., TestClient]):
+    auth_service_calls.clear()
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    cache_gen.cache.flush()
+    fallback = auth.remote_authorization(AUTH_URL, cache_gen=cache_gen, client=auth_client)
+
+    with pytest.raises(AssertionError):
+        auth.jwt_authorization(f"{AUTH_URL}/jwks/", fallback=fallback, cache_gen=lambda: None)
+
+    # The fallback keeps using the cache it was configured with
+    with jwt_app(fallback=fallback) as app_client:
+        response = app_client.get("/auth-info/", headers={"authorization": f"Bearer {USER_KEY}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"sid": "d4ad3d03-1cbe-40a2-8002-e060a65fede0"}
+        assert auth.keygen(f"Bearer {USER_KEY}", prefix="authorizer:") in cache_gen.cache.db
+
+        token = jwt_encode({"aud": "api"}, kid="unknown")
+        response = app_client.get("/auth-info/", headers={"authorization": token})
+        assert response.status_code == status.HTTP_200_OK
+
+    assert len(auth_service_calls) == 2
+
+
+def test_authorization_payload_projection():
+    auth_service_calls.clear()
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    projected_authorizer = auth.remote_authorization(
+        AUTH_URL,
+        client=auth_client,
+        forward_headers=["Authorization", "X-Request-Id", "X-Missing"],
+        forward_cookies=False,
+        forward_query_params=["tenant"],
+    )
+
+    app = FastAPI(dependencies=[Depends(projected_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+
+    response = TestClient(app).get(
+        "/health/",
+        params={"tenant": "dotz", "page": "2"},
+        headers={"authorization": f"Bearer {USER_KEY}", "x-request-id": "42", "user-agent": "x"},
+        cookies={"session": "s3cr3t"},
+    )
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert auth_service_calls == [
+        {
+            "method": "GET",
+            "path": "/health/",
+            "query_params": {"tenant": "dotz"},
+            "headers": {"authorization": f"Bearer {USER_KEY}", "x-request-id": "42"},
+        }
+    ]
+
+
+@pytest.mark.parametrize(
+    "codec", ["json", "msgpack", codecs.get_codec("orjson", compress_threshold=0)]
+)
+def test_cache_entries_use_codec(
+    codec: Any, httpx_asyncmock: AsyncMock, authorized: Callable[..., Response]
+):
+    codec_authorizer = auth.remote_authorization(AUTH_URL, cache_gen=cache_gen, codec=codec)
+
+    app = FastAPI(dependencies=[Depends(codec_authorizer)])
+    app.get("/auth-info/")(scope_info)
+    app_client = TestClient(app)
+    headers = {"authorization": f"Bearer {USER_KEY}"}
+    key = auth.keygen(headers["authorization"], prefix="authorizer:")
+
+    httpx_asyncmock.return_value = authorized(path="/auth-info/")
+
+    for _ in range(2):
+        response = app_client.get("/auth-info/", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"sid": "d4ad3d03-1cbe-40a2-8002-e060a65fede0"}
+
+    assert httpx_asyncmock.await_count == 1
+    assert codecs.loads(cache_gen.cache.db[key])["authorized"]
+
+    cache_gen.cache.db[key] = b"\x00?garbage"
+    response = app_client.get("/auth-info/", headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert httpx_asyncmock.await_count == 2
+
+
+class SlowCache(FakeCache):
+    async def set(self, key: str, value: str, ttl: Optional[int] = None):
+        await asyncio.sleep(0.05)
+
+        if key == auth.keygen("Bearer broken", prefix="authorizer:"):
+            raise ConnectionError("Redis is offline")
+
+        self.db[key] = value
+
+
+def test_write_behind_cache_writes():
+    cache = SlowCache()
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    write_behind_authorizer = auth.remote_authorization(
+        AUTH_URL,
+        cache_gen=lambda: cache,
+        client=auth_client,
+        write_behind=True,
+        max_pending_writes=3,
+    )
+
+    app = FastAPI(dependencies=[Depends(write_behind_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+    tokens = ["broken", "user-1", "user-2", "user-3"]
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            for token in tokens:
+                response = await client.get(
+                    "/health/", headers={"authorization": f"Bearer {token}"}
+                )
+                assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        assert cache.db == {}
+        assert len(write_behind_authorizer.writes) == 3
+
+        await write_behind_authorizer.shutdown()
+
+    asyncio.run(main())
+
+    assert len(cache.db) == 2
+    assert write_behind_authorizer.writes.errors == 1
+    assert write_behind_authorizer.writes.dropped == 1
+
+
+def test_write_behind_outlives_request_cache():
+    db: Dict[str, Any] = {}
+
+    with pytest.raises(AssertionError):
+        auth.remote_authorization(AUTH_URL, cache_gen=closing_cache_gen(db), write_behind=True)
+
+    auth_client = AsyncClient(transport=ASGITransport(app=auth_service))
+    write_behind_authorizer = auth.remote_authorization(
+        AUTH_URL,
+        cache_gen=closing_cache_gen(db, TornDownCache),
+        client=auth_client,
+        write_behind=True,
+        background_cache=lambda: TornDownCache(db),
+    )
+
+    app = FastAPI(dependencies=[Depends(write_behind_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url=AUTH_URL) as client:
+            headers = {"authorization": f"Bearer {USER_KEY}"}
+            response = await client.get("/health/", headers=headers)
+            assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        await write_behind_authorizer.shutdown()
+
+    asyncio.run(main())
+
+    assert auth.keygen(f"Bearer {USER_KEY}", prefix="authorizer:") in db
+    assert write_behind_authorizer.writes.errors == 0
+
+
+def test_authorizer_metrics(httpx_asyncmock: AsyncMock, authorized: Callable[..., Response]):
+    increments = []
+    phases = []
+    metrics = CallbackMetrics(
+        on_increment=lambda name, value, labels: increments.append((name, labels)),
+        on_observe=lambda name, value, labels: phases.append(labels["phase"]),
+    )
+    breaker = CircuitBreaker(failure_threshold=1)
+    metered_authorizer = auth.remote_authorization(
+        AUTH_URL, cache_gen=cache_gen, metrics=metrics, breaker=breaker
+    )
+
+    app = FastAPI(dependencies=[Depends(metered_authorizer)])
+    app.get("/health/", status_code=status.HTTP_204_NO_CONTENT)(health_check)
+    app_client = TestClient(app)
+
+    httpx_asyncmock.return_value = authorized(path="/health/")
+    app_client.get("/health/", headers={"authorization": f"Bearer {USER_KEY}"})
+    app_client.get("/health/", headers={"authorization": f"Bearer {USER_KEY}"})
+
+    httpx_asyncmock.side_effect = ConnectTimeout("Connection timed out")
+    app_client.get("/health/", headers={"authorization": "Bearer xoxo"})
+    app_client.get("/health/", headers={"authorization": "Bearer xoxo"})
+
+    assert increments == [
+        (auth.CACHE_METRIC, {"result": "miss"}),
+        (auth.REMOTE_METRIC, {"status": "200"}),
+        (auth.CACHE_METRIC, {"result": "hit"}),
+        (auth.CACHE_METRIC, {"result": "miss"}),
+        (auth.REMOTE_METRIC, {"status": "error"}),
+        (auth.CACHE_METRIC, {"result": "miss"}),
+        (auth.REMOTE_METRIC, {"status": "circuit_open"}),
+    ]
+    assert phases == [
+        "cache_get",
+        "remote",
+        "cache_set",
+        "cache_get",
+        "decode",
+        "cache_get",
+        "remote",
+        "cache_get",
+    ]
@@ -0,0 +1,294 @@
+import zlib
+from typing import Any, Dict, List, Optional
+
+import fakeredis
+import pytest
+import redis.asyncio as redis
+from fakeredis.aioredis import FakeConnection
+from fastapi import APIRouter, Depends, FastAPI, Header, Response
+from fastapi.testclient import TestClient
+
+from fastapi_extras.caching import ResponseCache, etag_for, etag_matches
+from fastapi_extras.databases.memory import LocalCache
+from fastapi_extras.databases.redis import RedisManager
+from fastapi_extras.metrics import CallbackMetrics
+
+calls: Dict[str, int] = {}
+results: List[str] = []
+local_cache = LocalCache()
+response_cache = ResponseCache(
+    local_cache,
+    ttl=30,
+    vary=("Accept-Language",),
+    compress_threshold=256,
+    metrics=CallbackMetrics(on_increment=lambda _, __, labels: results.append(labels["result"])),
+)
+
+
+def count(name: str) -> None:
+    calls[name] = calls.get(name, 0) + 1
+
+
+def database() -> str:
+    count("database")
+    return "session"
+
+
+router = APIRouter(route_class=response_cache.route_class)
+
+
+@router.get("/items/{key}")
+@response_cache()
+def read_item(key: str, session: str = Depends(database), page: int = 1):
+    count("read_item")
+    return {"key": key, "session": session, "page": page}
+
+
+@router.get("/large")
+@response_cache(ttl=5, key=lambda _: "large")
+def read_large():
+    count("read_large")
+    return {"data": "x" * 1024}
+
+
+@router.get("/users/me")
+@response_cache(vary=("X-User",))
+def read_me(x_user: Optional[str] = Header(None)):
+    count("read_me")
+    return {"user": x_user}
+
+
+@router.get("/session")
+@response_cache()
+def read_session(response: Response):
+    count("read_session")
+    response.set_cookie("session", "1")
+    return {}
+
+
+@router.get("/private")
+@response_cache()
+def read_private(response: Response):
+    count("read_private")
+    response.headers["cache-control"] = "private, max-age=10"
+    return {}
+
+
+@router.get("/missing")
+@response_cache()
+def read_missing(response: Response):
+    count("read_missing")
+    response.status_code = 404
+    return {}
+
+
+@router.api_route("/tagged", methods=["GET", "POST"])
+@response_cache()
+def read_tagged():
+    count("read_tagged")
+    return Response("tagged", headers={"etag": 'W/"v1"', "cache-control": "max-age=10"})
+
+
+@router.get("/uncached")
+def read_uncached():
+    count("read_uncached")
+    return {}
+
+
+app = FastAPI()
+app.include_router(router)
+client = TestClient(app)
+
+
+def setup_function():
+    calls.clear()
+    results.clear()
+    local_cache.clear()
+
+
+def test_response_cache_hit_skips_handler():
+    first = client.get("/items/foo")
+    second = client.get("/items/foo")
+
+    assert first.json() == second.json() == {"key": "foo", "session": "session", "page": 1}
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert first.headers["etag"] == second.headers["etag"] == etag_for(first.content)
+    assert second.headers["content-type"] == "application/json"
+    assert second.headers["content-length"] == str(len(first.content))
+    assert calls == {"database": 1, "read_item": 1}
+    assert results == ["miss", "hit"]
+
+    assert list(local_cache.entries) == ["response:/items/foo"]
+
+
+def test_response_cache_key_derivation():
+    client.get("/items/foo?page=2&sort=a&sort=b")
+    client.get("/items/foo?sort=a&sort=b&page=2")
+    client.get("/items/foo?page=3")
+    client.get("/items/foo?page=2&sort=a&sort=b", headers={"Accept-Language": "pt-BR"})
+    client.get("/users/me", headers={"X-User": "alice"})
+    client.get("/users/me", headers={"X-User": "bob"})
+    response = client.get("/users/me", headers={"X-User": "alice"})
+
+    assert response.json() == {"user": "alice"}
+    assert calls == {"database": 3, "read_item": 3, "read_me": 2}
+    assert all(key.startswith("response:/") for key in local_cache.entries)
+
+
+def test_response_cache_conditional_requests():
+    etag = client.get("/items/foo").headers["etag"]
+
+    response = client.get("/items/foo", headers={"If-None-Match": f'"other", W/{etag}'})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["x-cache"] == "HIT"
+    assert "content-length" not in response.headers
+
+    assert client.get("/items/bar", headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get("/items/foo", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    response = client.get("/tagged", headers={"If-None-Match": '"v1"'})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == 'W/"v1"'
+    assert response.headers["cache-control"] == "max-age=10"
+
+
+def test_response_cache_compression():
+    first = client.get("/large")
+    second = client.get("/large")
+    stored = local_cache.get_nowait("large")
+
+    assert first.json() == second.json()
+    assert second.headers["x-cache"] == "HIT"
+    assert calls == {"read_large": 1}
+    assert len(stored) < len(first.content)
+    assert zlib.decompress(stored.partition(b"\n")[2]) == first.content
+
+
+def test_response_cache_bypass():
+    for path in ["/session", "/private", "/missing", "/uncached"]:
+        client.get(path)
+        response = client.get(path)
+
+        assert "etag" not in response.headers
+
+    client.post("/tagged")
+    client.post("/tagged")
+
+    assert calls == {
+        "read_session": 2,
+        "read_private": 2,
+        "read_missing": 2,
+        "read_uncached": 2,
+        "read_tagged": 2,
+    }
+    assert results == ["bypass"] * 6
+    assert len(local_cache) == 0
+
+
+def test_response_cache_factory():
+    class StrCache:
+        def __init__(self) -> None:
+            self.db: Dict[str, Any] = {}
+
+        async def get(self, key: str) -> Optional[str]:
+            return self.db.get(key)
+
+        async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+            self.db[key] = value.decode("latin-1")
+
+    cache = StrCache()
+    factory = ResponseCache(lambda: cache, ttl=None)
+    factory_app = FastAPI()
+    factory_app.router.route_class = factory.route_class
+
+    @factory_app.get("/")
+    @factory(ttl=10)
+    def index():
+        count("index")
+        return "ok"
+
+    factory_client = TestClient(factory_app)
+
+    assert factory_client.get("/").json() == factory_client.get("/").json() == "ok"
+    assert calls == {"index": 1}
+    assert list(cache.db) == ["response:/"]
+
+
+def test_response_cache_redis_manager():
+    server = fakeredis.FakeServer()
+    manager = RedisManager("redis://localhost:6379/0")
+    manager.pool = redis.ConnectionPool(connection_class=FakeConnection, server=server)
+    redis_cache = ResponseCache(manager)
+    redis_app = FastAPI()
+    redis_app.router.route_class = redis_cache.route_class
+
+    @redis_app.get("/")
+    @redis_cache()
+    def index():
+        count("index")
+        return "ok"
+
+    # A single event loop for the whole session, since pooled connections are bound to one
+    with TestClient(redis_app) as redis_client:
+        assert redis_client.get("/").headers["x-cache"] == "MISS"
+        assert redis_client.get("/").headers["x-cache"] == "HIT"
+
+    assert calls == {"index": 1}
+    assert fakeredis.FakeRedis(server=server).exists("response:/")
+
+
+def test_response_cache_unavailable(caplog: pytest.LogCaptureFixture):
+    class BrokenCache:
+        async def get(self, key: str) -> Optional[str]:
+            raise ConnectionError("Redis is offline")
+
+        async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+            raise ConnectionError("Redis is offline")
+
+    broken_cache = ResponseCache(BrokenCache())
+    broken_app = FastAPI()
+    broken_app.router.route_class = broken_cache.route_class
+
+    @broken_app.get("/")
+    @broken_cache()
+    def index():
+        count("index")
+        return "ok"
+
+    broken_client = TestClient(broken_app)
+
+    for _ in range(2):
+        response = broken_client.get("/")
+        assert response.json() == "ok"
+        assert response.headers["x-cache"] == "MISS"
+
+    assert calls == {"index": 2}
+    assert "Cache get failed" in caplog.text
+    assert "Cache set failed" in caplog.text
+
+
+def test_response_cache_unreadable_entry(caplog: pytest.LogCaptureFixture):
+    client.get("/items/foo")
+    key = next(iter(local_cache.entries))
+    local_cache.set_nowait(key, b"garbage")
+
+    response = client.get("/items/foo")
+
+    # Treated as a miss, and the entry is replaced by a readable one
+    assert response.status_code == 200
+    assert response.headers["x-cache"] == "MISS"
+    assert client.get("/items/foo").headers["x-cache"] == "HIT"
+    assert calls["read_item"] == 2
+    assert "Cache entry is unreadable" in caplog.text
+
+
+def test_etag_matches():
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches('W/"a"', '"b", "a"')
+    assert etag_matches('"a"', "*")
+    assert not etag_matches('"a"', '"b"')
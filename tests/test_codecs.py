@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from fastapi_extras import codecs
+
+ENTRY = {"authorized": True, "context": {"sid": "d4ad3d03-1cbe-40a2-8002-e060a65fede0"}}
+
+
+@pytest.mark.parametrize("name", ["auto", "json", "orjson", "msgpack"])
+def test_codecs_roundtrip(name: str):
+    codec = codecs.get_codec(name)
+    assert codec.loads(codec.dumps(ENTRY)) == ENTRY
+
+
+@pytest.mark.parametrize("name", ["auto", "json", "orjson", "msgpack"])
+def test_codecs_read_every_format(name: str):
+    values = [json.dumps(ENTRY), json.dumps(ENTRY).encode()] + [
+        codecs.get_codec(other, compress_threshold=0).dumps(ENTRY)
+        for other in ["json", "orjson", "msgpack"]
+    ]
+
+    codec = codecs.get_codec(name)
+    assert all(codec.loads(value) == ENTRY for value in values)
+
+
+def test_json_codecs_stay_untagged():
+    assert json.loads(codecs.get_codec("json").dumps(ENTRY)) == ENTRY
+    assert json.loads(codecs.get_codec("orjson").dumps(ENTRY)) == ENTRY
+    assert codecs.get_codec("msgpack").dumps(ENTRY).startswith(codecs.MSGPACK_TAG)
+
+
+def test_compressed_codec_threshold():
+    codec = codecs.get_codec("json", compress_threshold=128)
+    large = {"authorized": True, "context": {"roles": ["admin"] * 100}}
+
+    assert codec.dumps(ENTRY) == json.dumps(ENTRY)
+    assert codec.dumps(large).startswith(codecs.ZLIB_TAG)
+    assert codec.loads(codec.dumps(large)) == large
+
+
+def test_invalid_codecs():
+    with pytest.raises(ValueError):
+        codecs.get_codec("pickle")
+
+    with pytest.raises(ValueError):
+        codecs.loads(b"\x00?")
+
+
+def test_loads_without_orjson(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(codecs, "orjson", None)
+
+    assert codecs.loads(json.dumps(ENTRY)) == ENTRY
+    assert codecs.loads(json.dumps(ENTRY).encode()) == ENTRY
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+from fastapi_extras.concurrency import CircuitBreaker, MicroBatcher, SingleFlight, TaskSet
+
+
+def test_single_flight_shares_result():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def main():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("foo", compute) for _ in range(5)))
+        assert len(flights) == 0
+        return results
+
+    assert asyncio.run(main()) == [1] * 5
+    assert len(calls) == 1
+
+
+def test_single_flight_shares_error():
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(
+            *(flights.do("foo", fail) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_single_flight_survives_cancelled_caller():
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "bar"
+
+    async def main():
+        flights = SingleFlight()
+        leader = asyncio.ensure_future(flights.do("foo", compute))
+        follower = asyncio.ensure_future(flights.do("foo", compute))
+
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        return await follower
+
+    assert asyncio.run(main()) == "bar"
+
+
+def test_task_set_drains_and_counts_errors():
+    done = []
+
+    async def work(fail: bool):
+        await asyncio.sleep(0.01)
+
+        if fail:
+            raise ValueError("boom")
+
+        done.append(1)
+
+    async def main():
+        tasks = TaskSet()
+        tasks.spawn(work(False))
+        tasks.spawn(work(True))
+        assert len(tasks) == 2
+
+        await tasks.drain()
+        return tasks
+
+    tasks = asyncio.run(main())
+
+    assert len(tasks) == 0
+    assert tasks.errors == 1
+    assert done == [1]
+
+
+def test_circuit_breaker_states():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10, timer=lambda: now[0])
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    now[0] = 10
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_circuit_breaker_release():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, timer=lambda: now[0])
+
+    breaker.release()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    now[0] = 10
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_micro_batcher_groups_submissions():
+    batches = []
+
+    async def double(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(double, max_size=4, window=0.01)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        await batcher.drain()
+        return results
+
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8, 10]
+    assert batches == [[0, 1, 2, 3], [4, 5]]
+
+
+def test_micro_batcher_propagates_errors():
+    async def broken(items):
+        return items[1:]
+
+    async def main():
+        batcher = MicroBatcher(broken, window=0)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(2)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
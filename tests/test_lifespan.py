@@ -0,0 +1,169 @@
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import fakeredis
+import pytest
+import redis.asyncio as redis
+from fakeredis.aioredis import FakeConnection
+from fastapi import Depends, FastAPI, status
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from fastapi_extras.databases.redis import RedisManager
+from fastapi_extras.lifespan import READY_METRIC, STARTUP_METRIC, ResourceManager
+from fastapi_extras.metrics import CallbackMetrics
+from fastapi_extras.orm.sqlalchemy import AsyncDatabase, Database
+
+
+class Resource:
+    def __init__(
+        self,
+        name: str,
+        events: List[str],
+        delay: float = 0,
+        error: Optional[Exception] = None,
+        shutdown_error: Optional[Exception] = None,
+    ) -> None:
+        self.name = name
+        self.events = events
+        self.delay = delay
+        self.error = error
+        self.shutdown_error = shutdown_error
+
+    async def startup(self) -> None:
+        self.events.append(f"start:{self.name}")
+        await asyncio.sleep(self.delay)
+
+        if self.error is not None:
+            raise self.error
+
+        self.events.append(f"started:{self.name}")
+
+    async def shutdown(self) -> None:
+        self.events.append(f"shutdown:{self.name}")
+
+        if self.shutdown_error is not None:
+            raise self.shutdown_error
+
+
+def test_resource_manager():
+    events: List[str] = []
+    observed: List[Tuple[str, float, Dict[str, str]]] = []
+    gauges: List[Tuple[str, float, Dict[str, str]]] = []
+    manager = ResourceManager(
+        Resource("redis", events, delay=0.02),
+        metrics=CallbackMetrics(
+            on_observe=lambda *args: observed.append(args),
+            on_gauge=lambda *args: gauges.append(args),
+        ),
+    )
+    invalidator = manager.register(Resource("invalidator", events))
+
+    app = FastAPI(lifespan=manager.lifespan)
+
+    @app.get("/ready", dependencies=[Depends(manager.readiness)])
+    def ready():
+        return {"ready": True}
+
+    client = TestClient(app)
+
+    assert client.get("/ready").status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    with client:
+        # Started concurrently: the fast resource finishes while the slow one is warming up
+        assert events == [
+            "start:redis",
+            "start:invalidator",
+            "started:invalidator",
+            "started:redis",
+        ]
+        assert client.get("/ready").json() == {"ready": True}
+
+        with pytest.raises(AssertionError):
+            manager.register(invalidator)
+
+    assert events[-2:] == ["shutdown:invalidator", "shutdown:redis"]
+    assert client.get("/ready").status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert [(name, labels) for name, _, labels in observed] == [
+        (STARTUP_METRIC, {"resource": "Resource"}),
+        (STARTUP_METRIC, {"resource": "Resource"}),
+    ]
+    assert [(name, value) for name, value, _ in gauges] == [(READY_METRIC, 1), (READY_METRIC, 0)]
+
+
+def test_resource_manager_startup_failure(caplog: pytest.LogCaptureFixture):
+    events: List[str] = []
+    manager = ResourceManager(
+        Resource("database", events, error=ConnectionError("refused")),
+        Resource("redis", events, shutdown_error=RuntimeError("boom")),
+        Resource("cache", events),
+    )
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.startup())
+
+    assert not manager.ready
+    # Every resource is shut down, even after one of them fails to
+    assert events[-3:] == ["shutdown:cache", "shutdown:redis", "shutdown:database"]
+    assert "Failed to shut down Resource" in caplog.text
+
+
+def test_resource_manager_prewarms_pools(tmp_path: Path):
+    database = Database(f"sqlite:///{tmp_path / 'sync.sqlite3'}", min_connections=3)
+    async_database = AsyncDatabase(
+        f"sqlite+aiosqlite:///{tmp_path / 'async.sqlite3'}",
+        min_connections=2,
+        poolclass=AsyncAdaptedQueuePool,
+    )
+    redis_manager = RedisManager("redis://localhost:6379/0", min_connections=2)
+    redis_manager.pool = redis.ConnectionPool(
+        connection_class=FakeConnection, server=fakeredis.FakeServer()
+    )
+    manager = ResourceManager(database, async_database, redis_manager)
+
+    async def main():
+        await manager.startup()
+
+        assert manager.ready
+        assert database.engine.pool.checkedin() == 3
+        assert async_database.engine.pool.checkedin() == 2
+        assert len(redis_manager.pool._available_connections) == 2
+
+        await manager.shutdown()
+
+        assert database.engine.pool.checkedin() == 0
+        assert async_database.engine.pool.checkedin() == 0
+
+    asyncio.run(main())
+
+
+def test_database_startup_failure(tmp_path: Path):
+    database = Database(f"sqlite:///{tmp_path / 'sync.sqlite3'}", min_connections=2)
+    async_database = AsyncDatabase(
+        f"sqlite+aiosqlite:///{tmp_path / 'async.sqlite3'}",
+        min_connections=2,
+        poolclass=AsyncAdaptedQueuePool,
+    )
+
+    def fail(*_args: Any) -> None:
+        raise OperationalError("SELECT 1", {}, Exception("unhealthy"))
+
+    async def main():
+        for db in (database, async_database):
+            async with db.lifespan(None):
+                assert db.engine.pool.checkedin() == 2
+
+        for engine in (database.engine, async_database.engine.sync_engine):
+            event.listen(engine, "before_cursor_execute", fail)
+
+        for db in (database, async_database):
+            with pytest.raises(OperationalError, match="unhealthy"):
+                async with db.lifespan(None):
+                    pass  # pragma: no cover
+
+            assert db.engine.pool.checkedout() == 0
+
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+from typing import Any, Dict, List, Tuple
+
+from prometheus_client import CollectorRegistry
+
+from fastapi_extras.metrics import CallbackMetrics, OpenTelemetryMetrics, PrometheusMetrics
+
+
+class FakeInstrument:
+    def __init__(self):
+        self.calls: List[Tuple[float, Any]] = []
+
+    def add(self, value: float, attributes: Any = None):
+        self.calls.append((value, attributes))
+
+    def record(self, value: float, attributes: Any = None):
+        self.calls.append((value, attributes))
+
+    def set(self, value: float, attributes: Any = None):
+        self.calls.append((value, attributes))
+
+
+class FakeMeter:
+    def __init__(self):
+        self.instruments: Dict[str, FakeInstrument] = {}
+
+    def create_counter(self, name: str) -> FakeInstrument:
+        return self.instruments.setdefault(name, FakeInstrument())
+
+    def create_histogram(self, name: str) -> FakeInstrument:
+        return self.instruments.setdefault(name, FakeInstrument())
+
+    def create_gauge(self, name: str) -> FakeInstrument:
+        return self.instruments.setdefault(name, FakeInstrument())
+
+
+def test_prometheus_metrics():
+    registry = CollectorRegistry()
+    metrics = PrometheusMetrics(namespace="test", registry=registry)
+
+    metrics.increment("hits", result="hit")
+    metrics.increment("hits", 2, result="hit")
+    metrics.increment("calls")
+    metrics.observe("latency_seconds", 0.003, phase="remote")
+    metrics.gauge("pool_size", 5, database="primary")
+    metrics.gauge("pool_size", 3, database="primary")
+
+    assert registry.get_sample_value("test_hits_total", {"result": "hit"}) == 3
+    assert registry.get_sample_value("test_calls_total") == 1
+    assert registry.get_sample_value("test_latency_seconds_count", {"phase": "remote"}) == 1
+    assert registry.get_sample_value("test_latency_seconds_sum", {"phase": "remote"}) == 0.003
+    assert registry.get_sample_value("test_pool_size", {"database": "primary"}) == 3
+
+
+def test_opentelemetry_metrics():
+    meter = FakeMeter()
+    metrics = OpenTelemetryMetrics(meter)
+
+    metrics.increment("hits", result="hit")
+    metrics.increment("calls")
+    metrics.observe("latency", 0.5, phase="remote")
+    metrics.gauge("pool_size", 5)
+
+    assert meter.instruments["hits"].calls == [(1, {"result": "hit"})]
+    assert meter.instruments["calls"].calls == [(1, None)]
+    assert meter.instruments["latency"].calls == [(0.5, {"phase": "remote"})]
+    assert meter.instruments["pool_size"].calls == [(5, None)]
+
+    assert OpenTelemetryMetrics().meter is not None
+
+
+def test_callback_metrics():
+    increments = []
+    observations = []
+    gauges = []
+    metrics = CallbackMetrics(
+        on_increment=lambda *args: increments.append(args),
+        on_observe=lambda *args: observations.append(args),
+        on_gauge=lambda *args: gauges.append(args),
+    )
+
+    metrics.increment("hits", result="hit")
+    metrics.observe("latency", 0.5)
+    metrics.gauge("pool_size", 5, database="primary")
+    CallbackMetrics().increment("hits")
+    CallbackMetrics().observe("latency", 0.5)
+    CallbackMetrics().gauge("pool_size", 5)
+
+    assert increments == [("hits", 1, {"result": "hit"})]
+    assert observations == [("latency", 0.5, {})]
+    assert gauges == [("pool_size", 5, {"database": "primary"})]